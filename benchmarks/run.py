@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""Offline benchmarks of substance parsing, flash solves and unit conversion.
+
+The substances are built from the saved NIST WebBook pages in
+benchmarks/fixtures, so the network and the property cache are never used.
+Run it from the root of the repository:
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --filter sweep --compare results.json
+
+Every benchmark reports the time per call in seconds (best, mean and worst
+of the repetitions). The JSON output keeps the same records plus the
+platform and library versions, so results of different releases can be
+compared with --compare.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import timeit
+
+import numpy as np
+
+from helpers import converter
+from helpers.memo import PropertyMemo
+from streams.substance import Substance
+from streams.stream import Stream
+from streams.parameter import Parameter
+from opus.flash import Flash
+from opus.flash import solve_batch
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'fixtures')
+
+# From the most to the least volatile
+NAMES = ['Propane', 'Isobutane', 'Butane', 'Pentane', 'Hexane']
+
+# Cases of main.py and examples.ipynb: substances, compositions, temperature
+# in K, pressure in kPa and feed in kmol/h
+CASES = {
+    'main': (['Propane', 'Butane', 'Pentane', 'Hexane'],
+             [0.3, 0.1, 0.15, 0.45], 323, 200, 1000),
+    'example2': (['Propane', 'Butane', 'Hexane'],
+                 [0.1, 0.3, 0.6], 300, 200, 10),
+    'example3': (['Isobutane', 'Pentane', 'Hexane'],
+                 [0.4, 0.25, 0.35], 330, 300, 1000),
+}
+
+
+def load_page(name):
+    """Read the saved NIST page of a substance"""
+    path = os.path.join(FIXTURES, name.lower() + '.html')
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def load_substances(names=NAMES):
+    """Build the Substance objects from the saved pages"""
+    return {name: Substance(name, html=load_page(name)) for name in names}
+
+
+def make_flash(substances, case, memo=None):
+    """Build a Flash with fresh streams for one of the CASES"""
+    names, composition, temperature, pressure, flow_rate = CASES[case]
+    substances = [substances[name] for name in names]
+    inlet = Stream('Inlet', substances,
+                   Parameter('Mass Flow Rate', flow_rate, 'kmol/h'),
+                   composition,
+                   Parameter('Pressure', pressure, 'kPa'),
+                   Parameter('Temperature', temperature, 'K'))
+    vapor = Stream('Vapor', substances)
+    liquid = Stream('Liquid', substances)
+    return Flash('V-101', inlet, vapor, liquid, memo=memo)
+
+
+def cold_memo():
+    """A PropertyMemo that stores nothing, so every solve evaluates the
+    vapor pressures"""
+    return PropertyMemo(0)
+
+
+def bench_substances(substances):
+    for name in NAMES:
+        page = load_page(name)
+        yield ('substance_parse', {'substance': name},
+               lambda name=name, page=page: Substance(name, html=page))
+
+
+def bench_flash(substances):
+    # A full solve every call. Without invalidate() the repetitions after
+    # the first only write the products again
+    for case in CASES:
+        flash = make_flash(substances, case, cold_memo())
+
+        def solve(flash=flash):
+            flash.invalidate()
+            flash.solve()
+
+        yield 'flash_solve', {'case': case}, solve
+
+    # A solve with nothing changed since the last one
+    for case in CASES:
+        yield ('flash_solve_cached', {'case': case},
+               make_flash(substances, case).solve)
+
+    # The specifications the notebook reaches by stepping the temperature
+    specs = [
+        ('example2', ('liquid_composition', 0.85, 'hexane')),
+        ('example3', ('liquid_flow', 315, 'hexane')),
+    ]
+    for case, spec in specs:
+        flash = make_flash(substances, case)
+        start = CASES[case][2]
+
+        def solve_spec(flash=flash, start=start, spec=spec):
+            flash.inlet.temperature.value = start
+            flash.solve_spec(*spec)
+
+        yield 'flash_solve_spec', {'case': case, 'spec': spec[0]}, solve_spec
+
+
+def bench_converter(substances):
+    yield ('converter_pressure', {'size': 1},
+           lambda: converter.pressure(2.0, 'bar', 'kPa'))
+
+    values = np.linspace(0.1, 10, 100000)
+    yield ('converter_pressure', {'size': values.size},
+           lambda: converter.pressure(values, 'bar', 'kPa'))
+
+    names, composition = CASES['main'][:2]
+    mixture = {substances[name].tag: substances[name] for name in names}
+    fractions = {substances[name].tag: z
+                 for name, z in zip(names, composition)}
+    yield ('converter_flow_rate', {'basis': 'molar'},
+           lambda: converter.flow_rate(1, mixture, fractions, 'kmol/h',
+                                       'mol/s'))
+    yield ('converter_flow_rate', {'basis': 'mass'},
+           lambda: converter.flow_rate(1, mixture, fractions, 'kmol/h',
+                                       'g/s'))
+
+
+def bench_sweeps(substances):
+    for components in (2, 3, 4, 5):
+        names = NAMES[-components:]
+        mixture = [substances[name] for name in names]
+        composition = np.full(components, 1 / components)
+
+        for cases in (10, 1000, 100000):
+            temperatures = np.linspace(290, 340, cases)
+            params = {'components': components, 'cases': cases}
+            yield ('sweep_batch', params,
+                   lambda mixture=mixture, temperatures=temperatures,
+                   composition=composition: solve_batch(
+                       mixture, temperatures, 200, composition))
+
+            # The notebook pattern, one Flash.solve() per temperature
+            if cases > 1000:
+                continue
+            inlet = Stream('Inlet', mixture,
+                           Parameter('Mass Flow Rate', 100, 'kmol/h'),
+                           list(composition),
+                           Parameter('Pressure', 200, 'kPa'),
+                           Parameter('Temperature', 290, 'K'))
+            flash = Flash('V-101', inlet, Stream('Vapor', mixture),
+                          Stream('Liquid', mixture), memo=cold_memo())
+
+            # Every repetition starts cold, as the first one
+            def sweep_loop(flash=flash, temperatures=temperatures):
+                flash.invalidate()
+                for temperature in temperatures:
+                    flash.inlet.temperature.value = temperature
+                    flash.solve()
+
+            yield 'sweep_loop', params, sweep_loop
+
+
+BENCHMARKS = [bench_substances, bench_flash, bench_converter, bench_sweeps]
+
+
+def measure(function, repeat=5):
+    """Time a function.
+
+    The number of calls per repetition is chosen by timeit so that every
+    repetition takes at least 0.2 s.
+
+    Returns
+    -------
+    dict
+        Seconds per call: best, mean and worst of the repetitions.
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    times = [total / number for total in timer.repeat(repeat, number)]
+    return {
+        'number': number,
+        'repeat': repeat,
+        'best': min(times),
+        'mean': sum(times) / len(times),
+        'worst': max(times),
+    }
+
+
+def run(pattern=None, repeat=5):
+    """Run the benchmarks whose name contains pattern.
+
+    Returns
+    -------
+    list
+        One record per benchmark with its name, parameters and timings.
+    """
+    substances = load_substances()
+    results = []
+    for benchmark in BENCHMARKS:
+        for name, params, function in benchmark(substances):
+            if pattern is not None and pattern not in name:
+                continue
+            record = {'name': name, 'params': params}
+            record.update(measure(function, repeat))
+            results.append(record)
+            print(format_record(record))
+    return results
+
+
+def metadata():
+    import scipy
+    import bs4
+    return {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'bs4': bs4.__version__,
+    }
+
+
+def key(record):
+    return record['name'], json.dumps(record['params'], sort_keys=True)
+
+
+def format_record(record, baseline=None):
+    params = ', '.join('{}={}'.format(*item) for item in
+                       record['params'].items())
+    line = '{:<20} {:<40} {:>12.3e} s'.format(record['name'], params,
+                                              record['best'])
+    if baseline is not None:
+        line += '  x{:.2f}'.format(record['best'] / baseline['best'])
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', help='write the results to a JSON file')
+    parser.add_argument('--filter', help='run the benchmarks whose name '
+                        'contains this text')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='repetitions of every benchmark')
+    parser.add_argument('--compare', help='JSON file of a previous run. The '
+                        'ratio of the best times is printed')
+    args = parser.parse_args(argv)
+
+    results = run(args.filter, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'metadata': metadata(), 'results': results}, file,
+                      indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            previous = {key(record): record
+                        for record in json.load(file)['results']}
+        print('\nCompared with {}'.format(args.compare))
+        for record in results:
+            if key(record) in previous:
+                print(format_record(record, previous[key(record)]))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""This module provides an asyncio client for the NIST WebBook.
+
+It is the non-blocking counterpart of helpers.scraping for programs running
+an event loop. The requests are made by a requests Session of
+helpers.scraping.new_session(), with its pooled keep-alive connections and
+retries, in the default executor of the loop. On top of it the client adds:
+
+* A limit of simultaneous requests.
+* A timeout for every request, from sending it to the last byte.
+* A token bucket per host, so bursts of new substances do not flood NIST.
+* Request coalescing: concurrent requests with the same key share one
+  fetch, so many users asking for the same substance cost one download.
+
+Examples
+--------
+>>> async with AsyncClient(rate=2) as client:
+        html = await get_html('https://webbook.nist.gov/cgi/cbook.cgi'
+                              '?Name=propane&Mask=4', client)
+"""
+import asyncio
+from functools import partial
+from urllib.parse import urlsplit
+
+from helpers import instrumentation
+from helpers import scraping
+
+
+class TokenBucket:
+    """Represents a rate limit of rate requests per second with bursts of up
+    to burst requests."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = None
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a request is allowed"""
+        loop = asyncio.get_running_loop()
+        async with self.lock:
+            while True:
+                now = loop.time()
+                if self.updated is not None:
+                    self.tokens = min(self.burst, self.tokens
+                                      + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncClient:
+    """Represents a requests Session shared by coroutines.
+
+    Attributes
+    ----------
+    max_connections : int
+        Simultaneous requests, and connections kept per host.
+    rate : float
+        Requests per second allowed per host. None disables the limit.
+    burst : int
+        Requests allowed at once before the rate applies.
+    timeout : float
+        Seconds for a request, not counting the wait for a slot or the
+        rate limit. The session gets it too, so a server that stops
+        answering does not keep an executor thread forever.
+    session : requests.Session
+        Session of helpers.scraping.new_session() making the requests.
+    """
+
+    def __init__(self, max_connections=10, rate=5.0, burst=5, timeout=30.0,
+                 retries=3, backoff=0.5):
+        """Create a new AsyncClient object
+
+        Parameters
+        ----------
+        retries : int
+            Retries of a request after a connection error or a 429 or 5xx
+            response.
+        backoff : float
+            Seconds before the first retry. It doubles on every retry.
+        """
+        self.max_connections = max_connections
+        self.rate = rate
+        self.burst = burst
+        self.timeout = timeout
+        self.session = scraping.new_session(max_connections, retries, backoff)
+
+        self.limit = None
+        self.buckets = {}
+        self.pending = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        """Close the pooled connections"""
+        self.session.close()
+
+    async def coalesce(self, key, factory):
+        """Await factory() once for all the concurrent callers with the same
+        key.
+
+        Cancelling one caller does not cancel the shared coroutine while
+        others wait for it.
+        """
+        task = self.pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self.pending[key] = task
+            task.add_done_callback(lambda _: self.pending.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def get(self, url):
+        """Attempts to get the content at `url` with an HTTP GET request.
+
+        Returns the content if it is some kind of HTML/XML, otherwise None,
+        as helpers.scraping.simple_get() does. Concurrent calls for the same
+        url share one request.
+        """
+        return await self.coalesce(('get', url), lambda: self.get_once(url))
+
+    async def get_once(self, url):
+        if self.limit is None:
+            self.limit = asyncio.Semaphore(self.max_connections)
+
+        async with self.limit:
+            if self.rate is not None:
+                host = urlsplit(url).hostname
+                bucket = self.buckets.get(host)
+                if bucket is None:
+                    bucket = self.buckets[host] = TokenBucket(self.rate,
+                                                              self.burst)
+                await bucket.acquire()
+
+            loop = asyncio.get_running_loop()
+            try:
+                return await asyncio.wait_for(loop.run_in_executor(
+                    None, partial(scraping.simple_get, url, self.session,
+                                  self.timeout)), self.timeout)
+            except asyncio.TimeoutError:
+                if instrumentation.enabled:
+                    instrumentation.count('http.errors')
+                scraping.log_error('Error during requests to {0} : timed out '
+                                   'after {1} s'.format(url, self.timeout))
+                return None
+
+
+async def get_html(url, client):
+    """Get the HTML of a page with an AsyncClient.
+
+    Raises
+    ------
+    Exception
+        If nothing could be retrieved, the same as helpers.scraping.get_html()
+    """
+    response = await client.get(url)
+    if response is None:
+        raise Exception('Error retrieving contents at {}'.format(url))
+    return response
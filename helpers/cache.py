@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""This module provides a persistent on-disk cache for substance properties.
+
+Every entry is a small JSON file named after the Substance.tag and holding the
+parsed properties (molecular weight and Antoine rows) so a Substance can be
+built without downloading and parsing the NIST WebBook page again.
+"""
+import json
+import os
+import tempfile
+import time
+from urllib.parse import quote
+
+from helpers import instrumentation
+
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'ideal-distillation')
+
+
+class PropertyCache:
+    """Represents a directory of cached substance properties.
+
+    Entries are written to a temporary file and then moved in place, so any
+    number of processes can read the cache at the same time without ever
+    seeing a half written entry.
+
+    Attributes
+    ----------
+    directory : string
+        Folder where the entries are stored.
+    ttl : float
+        Seconds an entry is considered valid. None means it never expires.
+    max_entries : int
+        Maximum number of entries kept. The oldest entries are removed first.
+        None means there is no limit.
+    offline : bool
+        Cache-only mode. When True a Substance missing from the cache raises
+        LookupError instead of scraping NIST.
+    """
+
+    def __init__(self, directory=None, ttl=None, max_entries=None,
+                 offline=None):
+        """Create a new PropertyCache object
+
+        Parameters
+        ----------
+        directory : string
+            Folder where the entries are stored. By default the environment
+            variable IDEAL_DISTILLATION_CACHE or ~/.cache/ideal-distillation
+        ttl : float
+            Seconds an entry is considered valid.
+        max_entries : int
+            Maximum number of entries kept on disk.
+        offline : bool
+            Cache-only mode. By default it is enabled when the environment
+            variable IDEAL_DISTILLATION_OFFLINE is set to 1.
+        """
+        if directory is None:
+            directory = os.environ.get('IDEAL_DISTILLATION_CACHE',
+                                       DEFAULT_DIRECTORY)
+        if offline is None:
+            offline = os.environ.get('IDEAL_DISTILLATION_OFFLINE') == '1'
+
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.offline = offline
+
+    def path(self, tag):
+        """Return the file path of the entry for a Substance.tag"""
+        return os.path.join(self.directory, quote(tag, safe='') + '.json')
+
+    def get(self, tag):
+        """Read the properties stored for a Substance.tag
+
+        Parameters
+        ----------
+        tag : string
+            The Substance.tag used as key.
+
+        Returns
+        -------
+        dict
+            The stored record or None if the entry is missing or expired.
+        """
+        try:
+            with open(self.path(tag), 'r') as file:
+                record = json.load(file)
+        except (OSError, ValueError):
+            record = None
+
+        if record is not None and self.is_expired(record):
+            record = None
+
+        if instrumentation.enabled:
+            instrumentation.count('cache.hits' if record is not None
+                                  else 'cache.misses')
+        return record
+
+    def set(self, tag, record):
+        """Store the properties of a Substance.tag
+
+        Parameters
+        ----------
+        tag : string
+            The Substance.tag used as key.
+        record : dict
+            JSON serializable properties. The creation time is added under
+            the 'created' key.
+
+        Returns
+        -------
+        bool
+            True if the entry was written, False if the cache folder is not
+            writable.
+        """
+        record = dict(record, created=time.time())
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            handle, temporary = tempfile.mkstemp(dir=self.directory,
+                                                 suffix='.tmp')
+        except OSError:
+            return False
+
+        # The temporary file is removed whatever stops the write, i.e. a
+        # value json cannot serialize
+        try:
+            with os.fdopen(handle, 'w') as file:
+                json.dump(record, file)
+            os.replace(temporary, self.path(tag))
+        except BaseException as error:
+            try:
+                os.unlink(temporary)
+            except OSError:
+                pass
+            if isinstance(error, OSError):
+                return False
+            raise
+
+        self.evict()
+        return True
+
+    def is_expired(self, record):
+        """Check whether a record is older than the ttl"""
+        if self.ttl is None:
+            return False
+        return time.time() - record.get('created', 0) > self.ttl
+
+    def evict(self):
+        """Remove the expired entries and the oldest ones above max_entries"""
+        if self.ttl is None and self.max_entries is None:
+            return
+
+        entries = []
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+
+        entries.sort(reverse=True)
+        now = time.time()
+        for i, (modified, path) in enumerate(entries):
+            expired = self.ttl is not None and now - modified > self.ttl
+            full = self.max_entries is not None and i >= self.max_entries
+            if expired or full:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def clear(self):
+        """Remove every entry of the cache"""
+        if not os.path.isdir(self.directory):
+            return
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith('.json'):
+                try:
+                    os.remove(os.path.join(self.directory, file_name))
+                except OSError:
+                    pass
+
+
+# Cache used by every Substance unless another one is given. Set it to None to
+# disable the caching.
+default_cache = PropertyCache()
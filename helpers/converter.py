@@ -1,5 +1,146 @@
 # -*- coding: utf-8 -*-
-"""This module provides functions to convert among different unit sets"""
+"""This module provides functions to convert among different unit sets
+
+Every quantity has a table with the factor and offset that take a value in
+each unit to a base unit (K, Pa, s, mol and g). The factor and offset between
+two units are computed once and cached, so a conversion is a multiply-add and
+works the same on floats and NumPy arrays.
+"""
+from functools import lru_cache
+
+
+# Units : (factor, offset) so that base = value * factor + offset
+TEMPERATURE = {
+    'k': (1.0, 0.0),
+    'c': (1.0, 273.15),
+    'f': (5/9, 273.15 - 32 * 5/9),
+    'r': (5/9, 0.0),
+}
+
+PRESSURE = {
+    'pa': (1.0, 0.0),
+    'kpa': (1e3, 0.0),
+    'bar': (1e5, 0.0),
+    'atm': (101325.0, 0.0),
+    'psi': (6894.757293, 0.0),
+    'mmhg': (101325/760, 0.0),
+    'torr': (101325/760, 0.0),
+}
+
+TIME = {
+    's': (1.0, 0.0),
+    'm': (60.0, 0.0),
+    'h': (3600.0, 0.0),
+    'd': (86400.0, 0.0),
+    'day': (86400.0, 0.0),
+    'mon': (2592000.0, 0.0),
+    'month': (2592000.0, 0.0),
+    'y': (31536000.0, 0.0),
+    'year': (31536000.0, 0.0),
+}
+
+MOLAR_FLOW = {
+    'mol': (1.0, 0.0),
+    'kmol': (1e3, 0.0),
+    'lbmol': (453.59237, 0.0),
+}
+
+MASS_FLOW = {
+    'g': (1.0, 0.0),
+    'gr': (1.0, 0.0),
+    'kg': (1e3, 0.0),
+    'lb': (453.59237, 0.0),
+}
+
+UNITS = {
+    'temperature': TEMPERATURE,
+    'pressure': PRESSURE,
+    'time': TIME,
+    'molar_flow': MOLAR_FLOW,
+    'mass_flow': MASS_FLOW,
+}
+
+
+def register(quantity, units, factor, offset=0.0):
+    """Add a new unit to the registry.
+
+    Parameters
+    ----------
+    quantity : str
+        One of the keys of UNITS, i.e. 'pressure'.
+    units : str
+        Name of the new unit. Not case sensitive.
+    factor : float
+        Factor taking a value in the new unit to the base unit.
+    offset : float
+        Offset added after the factor to reach the base unit.
+
+    Examples
+    --------
+    >>> register('pressure', 'MPa', 1e6)
+    >>> pressure(1, 'MPa', 'bar')
+    10.0
+
+    """
+    UNITS[quantity][units.lower()] = (factor, offset)
+    factors.cache_clear()
+    flow_units.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def factors(quantity, from_units, to_units):
+    """Compute the factor and offset between two units of a quantity.
+
+    Parameters
+    ----------
+    quantity : str
+        One of the keys of UNITS, i.e. 'pressure'.
+    from_units : str
+        String with the name of the inlet units.
+    to_units : str
+        String with the desire outlet units.
+
+    Returns
+    -------
+    tuple
+        (factor, offset) so that converted = value * factor + offset.
+    """
+    table = UNITS[quantity]
+    try:
+        from_factor, from_offset = table[from_units.lower()]
+        to_factor, to_offset = table[to_units.lower()]
+    except KeyError:
+        raise ValueError('Cannot convert {} from {} to {}'
+                         .format(quantity, from_units, to_units))
+
+    return from_factor / to_factor, (from_offset - to_offset) / to_factor
+
+
+def convert(value, quantity, from_units, to_units):
+    """Convert a float or a NumPy array between two units of a quantity.
+
+    Parameters
+    ----------
+    value : float
+        The original value. It can be a NumPy array.
+    quantity : str
+        One of the keys of UNITS, i.e. 'pressure'.
+    from_units : str
+        String with the name of the inlet units.
+    to_units : str
+        String with the desire outlet units.
+
+    Returns
+    -------
+    float
+        The already converted value.
+    """
+    factor, offset = factors(quantity, from_units, to_units)
+    if factor == 1 and offset == 0:
+        return value
+    if offset == 0:
+        return value * factor
+    return value * factor + offset
 
 
 def temperature(value, from_units, to_units):
@@ -30,61 +171,7 @@ def temperature(value, from_units, to_units):
      176.0
 
     """
-
-    # Lowering to avoid case sensitive errors
-    from_units = from_units.lower()
-    to_units = to_units.lower()
-
-    # Check if both units are the same
-    if from_units == to_units:
-        return value
-
-    # Checking what is the initial units
-    # Converting from Celsius
-    elif from_units == 'c':
-        if to_units == 'f':
-            return (value * 9/5) + 32
-
-        elif to_units == 'k':
-            return value + 273.15
-
-        elif to_units == 'r':
-            return (value * 9/5) + 32 + 459.67
-
-    # Converting from Fahrenheit
-    elif from_units == 'f':          
-        if to_units == 'c':
-            return (value - 32) * 5/9
-
-        elif to_units == 'k':
-            return (value - 32) * 5/9 + 273.15
-
-        elif to_units == 'r':
-            return value + 459.67
-
-    # Converting from Kelvin
-    elif from_units == 'k':        
-        if to_units == 'c':
-            return value - 273.15
-
-        elif to_units == 'f':
-            return (value - 273.15) * 9/5 + 32
-
-        elif to_units == 'r':
-            return value * 9/5
-
-    # Converting from Ranking
-    elif from_units == 'r':
-        if to_units == 'c':
-            return (value - 491.67) * 5/9
-
-        elif to_units == 'f':
-            return value - 459.67
-
-        elif to_units == 'k':
-            return value * 5/9
-
-    return value
+    return convert(value, 'temperature', from_units, to_units)
 
 
 def pressure(value, from_units, to_units):
@@ -112,121 +199,10 @@ def pressure(value, from_units, to_units):
      Example of how much is an atm in psi
 
      >>> pressure(1, 'atm', 'psi')
-     14.69
+     14.6959...
 
     """
-
-    # Lowering to avoid case sensitive errors
-    from_units = from_units.lower()
-    to_units = to_units.lower()
-
-    # Check if both units are the same
-    if from_units == to_units:
-        return value
-
-    # Converting from atmosphere
-    elif from_units == 'atm':
-        if to_units == 'bar':
-            return value * 1.013
-
-        if to_units == 'pa':
-            return value * 101325
-
-        if to_units == 'kpa':
-            return value * 101.325
-
-        if to_units == 'psi':
-            return value * 14.69
-
-        if to_units == 'mmhg' or to_units == 'torr':
-            return value * 760 
-
-    # Converting from bar
-    elif from_units == 'bar':
-        if to_units == 'atm':
-            return value * 750.06
-
-        if to_units == 'pa':
-            return value * 100000
-
-        if to_units == 'kpa':
-            return value * 100
-
-        if to_units == 'psi':
-            return value * 14.50
-
-        if to_units == 'mmhg' or to_units == 'torr':
-            return value * 750.06 
-
-    # Converting from pascals
-    elif from_units == 'pa':
-        if to_units == 'atm':
-            return value / 101325
-
-        if to_units == 'bar':
-            return value / 100000
-
-        if to_units == 'kpa':
-            return value / 100
-
-        if to_units == 'psi':
-            return value / 6894.75
-
-        if to_units == 'mmhg' or to_units == 'torr':
-            return value / 133.322
-
-    # Converting from kilo pascals
-    elif from_units == 'kpa':
-        if to_units == 'atm':
-            return value / 101.325
-
-        if to_units == 'bar':
-            return value / 100.000
-
-        if to_units == 'pa':
-            return value * 100
-
-        if to_units == 'psi':
-            return value / 6.89475
-
-        if to_units == 'mmhg' or to_units == 'torr':
-            return value / 0.133322
-
-    # Converting from psi
-    if from_units == 'psi':
-        if to_units == 'atm':
-            return value / 14.69
-
-        if to_units == 'bar':
-            return value / 14.15
-
-        if to_units == 'pa':
-            return value * 6.89475
-
-        if to_units == 'kpa':
-            return value * 6.89e-3
-
-        if to_units == 'mmhg' or to_units == 'torr':
-            return value * 51.71                             
-
-    # Converting from Torr or mmhg
-    elif to_units == 'mmhg' or to_units == 'torr':
-        if to_units == 'atm':
-            return value / 760
-
-        if to_units == 'bar':
-            return value / 750.062
-
-        if to_units == 'pa':
-            return value * 133.322
-
-        if to_units == 'kpa':
-            return value * 0.133
-
-        if to_units == 'psi':
-            return value / 51.71   
-
-    return value
+    return convert(value, 'pressure', from_units, to_units)
 
 
 def time(value, from_units, to_units):
@@ -258,121 +234,10 @@ def time(value, from_units, to_units):
      How many hours does a year have?
 
      >>> time(1, 'y', 'h')
-     14.69
+     8760.0
 
     """
-
-    # Lowering to avoid case sensitive errors
-    from_units = from_units.lower()
-    to_units = to_units.lower()
-
-    # Check if both units are the same
-    if from_units == to_units:
-        return value
-    
-    # Converting from seconds
-    elif from_units == 's':
-        if to_units == 'm':
-            return value / 60
-
-        if to_units == 'h':
-            return value / 3600
-
-        if to_units == 'day' or to_units == 'd':
-            return value / 86400
-
-        if to_units == 'month' or to_units == 'mon':
-            return value / 2592000
-
-        if to_units == 'year' or to_units == 'y':
-            return value / 31536000
-
-    # Converting from minutes
-    elif from_units == 'm':
-        if to_units == 's':
-            return value * 60
-
-        if to_units == 'h':
-            return value / 60
-
-        if to_units == 'day' or to_units == 'd':
-            return value / 1440
-
-        if to_units == 'month' or to_units == 'mon':
-            return value / 43200
-
-        if to_units == 'year' or to_units == 'y':
-            return value / 525600
-
-    # Converting from hours
-    elif from_units == 'h':
-        if to_units == 's':
-            return value * 3600
-
-        if to_units == 'm':
-            return value * 60
-
-        if to_units == 'day' or to_units == 'd':
-            return value / 24
-
-        if to_units == 'month' or to_units == 'mon':
-            return value / 720
-
-        if to_units == 'year' or to_units == 'y':
-            return value / 8760
-        
-    # Converting from days
-    elif from_units == 'day' or from_units == 'd':
-        if to_units == 's':
-            return value * 86400
-
-        if to_units == 'm':
-            return value * 1440
-
-        if to_units == 'h':
-            return value * 24
-
-        if to_units == 'month' or to_units == 'mon':
-            return value / 30
-
-        if to_units == 'year' or to_units == 'y':
-            return value / 365
-
-    # Converting from months
-    elif from_units == 'month' or from_units == 'mon':
-        if to_units == 's':
-            return value * 2592000
-
-        if to_units == 'm':
-            return value * 43200
-
-        if to_units == 'h':
-            return value * 720
-
-        if to_units == 'day' or to_units == 'd':
-            return value * 30
-
-        if to_units == 'year' or to_units == 'y':
-            return value / 12
-
-    # Converting from years
-    elif from_units == 'year' or from_units == 'y':
-        if to_units == 's':
-            return value * 31536000
-
-        if to_units == 'm':
-            return value * 525600
-
-        if to_units == 'h':
-            return value * 8760
-
-        if to_units == 'day' or to_units == 'd':
-            return value * 365
-
-        if to_units == 'month' or to_units == 'mon':
-            return value * 12                    
-    
-    return value
+    return convert(value, 'time', from_units, to_units)
 
 
 def molar_flow(value, from_units, to_units):
@@ -393,47 +258,17 @@ def molar_flow(value, from_units, to_units):
     Returns
     -------
     float
-        The already converted value of the time.
+        The already converted value of the molar flow.
 
      Examples
      --------
      Equivalence between mol and kmol
 
      >>> molar_flow(1000, 'mol', 'kmol')
-     1
+     1.0
 
     """
-
-    # Lowering to avoid case sensitive errors
-    from_units = from_units.lower()
-    to_units = to_units.lower()
-
-    # Check if both units are the same
-    if from_units == to_units:
-        return value
-
-    # Converting from mol
-    elif from_units == 'mol':
-        if to_units == 'lbmol':
-            return value / 453.6
-        if to_units == 'kmol':
-            return value / 1000
-
-    # Converting from lbmol
-    elif from_units == 'lbmol':
-        if to_units == 'mol':
-            return value * 453.6
-        if to_units == 'kmol':
-            return value * 0.4536
-
-    # Converting from kmol
-    elif from_units == 'kmol':
-        if to_units == 'mol':
-            return value * 1000
-        if to_units == 'lbmol':
-            return value / 0.4536
-
-    return value
+    return convert(value, 'molar_flow', from_units, to_units)
 
 
 def mass_flow(value, from_units, to_units):
@@ -454,47 +289,26 @@ def mass_flow(value, from_units, to_units):
     Returns
     -------
     float
-        The already converted value of the time.
+        The already converted value of the mass flow.
 
      Examples
      --------
      Equivalence between g and kg
 
      >>> mass_flow(1000, 'g', 'kg')
-     1
+     1.0
 
     """
+    return convert(value, 'mass_flow', from_units, to_units)
 
-    # Lowering the string to avoid case sensitive errors.
-    from_units = from_units.lower()
-    to_units = to_units.lower()
 
-    # Check if both units are the same
-    if from_units == to_units:
-        return value
-
-    # Converting from grams
-    elif from_units == 'g' or from_units == 'gr':
-        if to_units == 'lb':
-            return value / 453.6
-        if to_units == 'kg':
-            return value / 1000
-
-    # Converting from pounds
-    elif from_units == 'lb':
-        if to_units == 'g' or to_units == 'gr':
-            return value * 453.6
-        if to_units == 'kg':
-            return value * 0.4536
-
-    # Converting from kilograms
-    elif from_units == 'kg':
-        if to_units == 'g' or to_units == 'gr':
-            return value * 1000
-        if to_units == 'lb':
-            return value / 0.4536
-
-    return value        
+def quantity_of(units):
+    """Return 'molar_flow' or 'mass_flow' for a flow unit such as kmol or kg"""
+    units = units.lower()
+    for quantity in ('molar_flow', 'mass_flow'):
+        if units in UNITS[quantity]:
+            return quantity
+    raise ValueError('Unknown flow units {}'.format(units))
 
 
 def change_flow_basis(value, substances, compositions, from_units, to_units):
@@ -512,7 +326,7 @@ def change_flow_basis(value, substances, compositions, from_units, to_units):
     substances : dict
         Set of Substance.tag : Substance pairs
     compositions : dict
-        Set of Substance.tag : composition pairs
+        Set of Substance.tag : molar fraction pairs
     from_units : str
         String with the initial units
     to_units : str
@@ -550,55 +364,50 @@ def change_flow_basis(value, substances, compositions, from_units, to_units):
     68.64
 
     """
+    from_quantity = quantity_of(from_units)
+    to_quantity = quantity_of(to_units)
+    if from_quantity == to_quantity:
+        return convert(value, from_quantity, from_units, to_units)
 
-    # Lowering the string to avoid case sensitive errors.
-    from_units = from_units.lower()
-    to_units = to_units.lower()
-
-    # Converting from molar to mass flow
-    if (from_units == 'kmol' or from_units == 'lbmol' or from_units == 'mol')\
-            and (to_units == 'kg' or to_units == 'lb' or to_units ==
-                 'g' or to_units == 'gr'):
-
-        weight = 0
-        for tag, substance in substances.items():
-            weight += compositions[tag] * substance.molecular_weight
-
-        total = value * weight
-        
-        # Checking the new from_units
-        if from_units == 'kmol':
-            from_units = 'kg'
-        elif from_units == 'lbmol':
-            from_units = 'lb'
-        elif from_units == 'mol':
-            from_units = 'g'
-
-        return mass_flow(total, from_units, to_units)
-
-    # Converting from mass to molar flow
-    elif (from_units == 'kg' or from_units == 'lb' or from_units == 'g' or
-            from_units == 'gr') and (to_units == 'kmol' or to_units ==
-                                     'lbmol' or to_units == 'mol'):
-
-        weight = 0
-        for tag, substance in substances.items():
-            weight += compositions[tag] / substance.molecular_weight
-
-        total = value * weight
-        
-        # Checking the new from_units
-        if from_units == 'kg':
-            from_units = 'kmol'
-        elif from_units == 'lb':
-            from_units = 'lbmol'
-        elif from_units == 'g' or from_units == 'gr':
-            from_units = 'mol'
-
-        return molar_flow(total, from_units, to_units)
-
-    else:
-        return value
+    # Molecular weight of the mixture in g/mol
+    weight = 0
+    for tag, substance in substances.items():
+        weight += compositions[tag] * substance.molecular_weight
+
+    # Going through the base units mol and g
+    if from_quantity == 'molar_flow':
+        grams = convert(value, from_quantity, from_units, 'mol') * weight
+        return convert(grams, to_quantity, 'g', to_units)
+
+    moles = convert(value, from_quantity, from_units, 'g') / weight
+    return convert(moles, to_quantity, 'mol', to_units)
+
+
+@lru_cache(maxsize=None)
+def flow_units(from_units, to_units):
+    """Parse two compound flow units such as 'kmol/h' and 'g/s'.
+
+    Parameters
+    ----------
+    from_units : str
+        String with the initial units
+    to_units : str
+        String with the outlet units
+
+    Returns
+    -------
+    tuple
+        (from_flow, to_flow, factor) with the flow part of both units and
+        the factor that converts the time part.
+    """
+    # The first part of the split string will be the flow units and the
+    # second part is the time units.
+    from_flow, from_time = from_units.lower().split('/')
+    to_flow, to_time = to_units.lower().split('/')
+
+    # A rate per hour is 1/3600 of the rate per second
+    factor, _ = factors('time', to_time, from_time)
+    return from_flow, to_flow, factor
 
     
 def flow_rate(value, substances, compositions, from_units, to_units):
@@ -610,6 +419,9 @@ def flow_rate(value, substances, compositions, from_units, to_units):
     * Time: seconds (s), minutes (m), hours (h) ,days (d), months (mon) and
     years (year, y).
 
+    The split of the compound units is cached, so converting many times
+    between the same units costs a multiply.
+
     Parameters
     ----------
     value : float
@@ -617,7 +429,7 @@ def flow_rate(value, substances, compositions, from_units, to_units):
     substances : dict
         Set of Substance.tag : Substance pairs
     compositions : dict
-        Set of Substance.tag : composition pairs
+        Set of Substance.tag : molar fraction pairs
     from_units : str
         String with the initial units
     to_units : str
@@ -651,40 +463,9 @@ def flow_rate(value, substances, compositions, from_units, to_units):
             'hexane' : 0.45
         }
     >>> flow_rate(1, substances, compositions, 'kmol/h', 'g/s')
-    68.64
+    19.067...
     """
-
-    # Lowering the string to avoid case sensitive errors.
-    from_units = from_units.lower()
-    to_units = to_units.lower()
-
-    # The first part of the split string will be the flow units and the
-    # second part is the time units.
-    from_units = from_units.split('/')
-    to_units = to_units.split('/')
-    time_value = time(1, from_units[1], to_units[1])
-
-    # Don't need time units more
-    from_units = from_units[0]
-    to_units = to_units[0]
-
-    # Check the sort of conversion. From Mass to Mass, From Molar to Molar or
-    # Change of basis
-    # Converting from molar to molar flows
-    if (from_units == 'kmol' or from_units == 'lbmol' or from_units == 'mol')\
-            and (to_units == 'kmol' or to_units == 'lbmol' or to_units ==
-                 'mol'):
-        flow_value = molar_flow(value, from_units, to_units)
-
-    # Converting from mass to mass flows
-    elif (from_units == 'kg' or from_units == 'lb' or from_units == 'g'
-          or from_units == 'gr') and (to_units == 'kg' or to_units == 'lb' or
-                                      to_units == 'g' or to_units == 'gr'):
-
-        flow_value = mass_flow(value, from_units, to_units)
-
-    else:
-        flow_value = change_flow_basis(value, substances, compositions,
-                                       from_units, to_units)
-
-    return flow_value / time_value
+    from_flow, to_flow, factor = flow_units(from_units, to_units)
+    flow_value = change_flow_basis(value, substances, compositions,
+                                   from_flow, to_flow)
+    return flow_value * factor
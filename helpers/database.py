@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""This module provides a precompiled, read-only database of substance
+properties stored as columns in one binary file.
+
+The file is memory mapped and its columns are NumPy views of the mapping, so
+opening it costs a few microseconds and only the pages that are read are
+loaded from disk. Substance looks here first, then in the property cache and
+last on the NIST WebBook, so hosts without network access work with the
+substances of the bundled database.
+
+Layout, little endian, every column aligned to 8 bytes:
+
+    header        magic 'IDDB', version, substances n, Antoine rows m
+    tag_offsets   int64 (n + 1)   into the tags blob
+    name_offsets  int64 (n + 1)   into the names blob
+    row_offsets   int64 (n + 1)   into the Antoine columns
+    molecular_weight  float64 (n)
+    low, high, A, B, C  float64 (m) each
+    tags, names   UTF-8 blobs
+
+The substances are sorted by tag, so a lookup is a bisection.
+
+Building the database from a directory of saved WebBook pages, one page per
+substance named after it (i.e. propane.html):
+
+    python -m helpers.database benchmarks/fixtures helpers/properties.db
+"""
+import argparse
+import bisect
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+
+from helpers.helpers import name_to_tag
+
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'properties.db')
+
+MAGIC = b'IDDB'
+VERSION = 1
+HEADER = struct.Struct('<4sIII')
+
+
+class PropertyDatabase:
+    """Represents a memory mapped database of substance properties.
+
+    Attributes
+    ----------
+    path : string
+        The database file.
+    tags : list
+        Substance.tag of every substance, sorted.
+    molecular_weight : numpy.ndarray
+        Molecular weight of every substance.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        """Open a database file
+
+        Parameters
+        ----------
+        path : string
+            The file written by build().
+        """
+        self.path = path
+        with open(path, 'rb') as file:
+            self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, n, m = HEADER.unpack_from(self.mapping, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a property database of version {}'
+                             .format(path, VERSION))
+
+        offset = HEADER.size
+        columns = []
+        for dtype, count in [('<i8', n + 1)] * 3 + [('<f8', n)] \
+                + [('<f8', m)] * 5:
+            columns.append(np.frombuffer(self.mapping, dtype=dtype,
+                                         count=count, offset=offset))
+            offset += 8 * count
+        (self.tag_offsets, self.name_offsets, self.row_offsets,
+         self.molecular_weight, self.low, self.high,
+         self.A, self.B, self.C) = columns
+
+        self.blob = offset
+        end = self.blob + int(self.tag_offsets[-1])
+        self.tags = self.mapping[self.blob:end].decode('utf-8') \
+            .split('\0')[:n] if n else []
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __contains__(self, name):
+        return self.find(name) is not None
+
+    def find(self, name):
+        """Position of a substance by name or Substance.tag, or None"""
+        tag = name_to_tag(name)
+        index = bisect.bisect_left(self.tags, tag)
+        if index < len(self.tags) and self.tags[index] == tag:
+            return index
+        return None
+
+    def name(self, index):
+        """Name of the substance at a position"""
+        start = self.blob + int(self.tag_offsets[-1])
+        return self.mapping[start + int(self.name_offsets[index]):
+                            start + int(self.name_offsets[index + 1]) - 1] \
+            .decode('utf-8')
+
+    def get(self, name):
+        """Read the properties of a substance by name or Substance.tag
+
+        Returns
+        -------
+        dict
+            Record with 'name', 'molecular_weight' and 'antoine' as
+            ((lower_lim, higher_lim), A, B, C) rows, the same as the property
+            cache, or None if the substance is not in the database.
+        """
+        index = self.find(name)
+        if index is None:
+            return None
+
+        rows = slice(int(self.row_offsets[index]),
+                     int(self.row_offsets[index + 1]))
+        antoine = tuple(((low, high), A, B, C) for low, high, A, B, C in zip(
+            self.low[rows].tolist(), self.high[rows].tolist(),
+            self.A[rows].tolist(), self.B[rows].tolist(),
+            self.C[rows].tolist()))
+        return {
+            'name': self.name(index),
+            'molecular_weight': float(self.molecular_weight[index]),
+            'antoine': antoine,
+        }
+
+
+def build(substances, path):
+    """Write a database file.
+
+    Parameters
+    ----------
+    substances : list
+        Substance objects, or any object with name, tag, molecular_weight and
+        antoine rows.
+    path : string
+        File to write.
+    """
+    substances = sorted(substances, key=lambda substance: substance.tag)
+    tags = [substance.tag for substance in substances]
+    if len(set(tags)) != len(tags):
+        raise ValueError('The substances of a database must be unique')
+
+    rows = [row for substance in substances for row in substance.antoine]
+    counts = [len(substance.antoine) for substance in substances]
+    tags_blob = ''.join(tag + '\0' for tag in tags).encode('utf-8')
+    names = [(substance.name + '\0').encode('utf-8')
+             for substance in substances]
+
+    def offsets(sizes):
+        return np.concatenate(([0], np.cumsum(sizes))).astype('<i8')
+
+    columns = [
+        offsets([len((tag + '\0').encode('utf-8')) for tag in tags]),
+        offsets([len(name) for name in names]),
+        offsets(counts),
+        np.array([substance.molecular_weight for substance in substances],
+                 dtype='<f8'),
+    ]
+    columns += [np.array([row[0][0] for row in rows], dtype='<f8'),
+                np.array([row[0][1] for row in rows], dtype='<f8')]
+    columns += [np.array([row[i] for row in rows], dtype='<f8')
+                for i in (1, 2, 3)]
+
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(substances), len(rows)))
+        for column in columns:
+            file.write(column.tobytes())
+        file.write(tags_blob)
+        file.write(b''.join(names))
+    os.replace(temporary, path)
+
+
+def build_from_pages(directory, path):
+    """Write a database with the substances of a directory of saved NIST
+    WebBook pages, one file per substance named after it.
+
+    Returns
+    -------
+    list
+        Names of the substances written.
+    """
+    from streams.substance import Substance
+
+    substances = []
+    for filename in sorted(os.listdir(directory)):
+        stem, extension = os.path.splitext(filename)
+        if extension.lower() not in ('.html', '.htm'):
+            continue
+        with open(os.path.join(directory, filename), 'rb') as file:
+            html = file.read()
+        name = stem.replace('_', ' ').title()
+        substances.append(Substance(name, html=html))
+
+    build(substances, path)
+    return [substance.name for substance in substances]
+
+
+def load_default():
+    """Open the bundled database, or return None if it is missing"""
+    try:
+        return PropertyDatabase(DEFAULT_PATH)
+    except (OSError, ValueError):
+        return None
+
+
+# Database used by every Substance unless another one is given. Setting it
+# to None makes Substance skip the database.
+default_database = load_default()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Build a property database from saved NIST pages')
+    parser.add_argument('pages', help='directory of saved WebBook pages')
+    parser.add_argument('output', nargs='?', default=DEFAULT_PATH,
+                        help='database file to write')
+    args = parser.parse_args(argv)
+
+    names = build_from_pages(args.pages, args.output)
+    print('{} substances written to {}: {}'.format(
+        len(names), args.output, ', '.join(names)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""Opt-in counters, timers and hooks for the solvers and the I/O.
+
+Nothing is recorded until enable() is called (or the environment variable
+IDEAL_DISTILLATION_INSTRUMENTATION is 1). Every call site checks the module
+flag first, so when it is off the cost is one attribute lookup:
+
+    if instrumentation.enabled:
+        instrumentation.count('psat.evaluations')
+
+The events recorded by the package are:
+
+* http: requests, bytes and latency of helpers.scraping.simple_get().
+* parse.molecular_weight and parse.antoine: time to parse a NIST page.
+* cache.hits and cache.misses: lookups of helpers.cache.PropertyCache.
+* psat.evaluations: vapor pressures evaluated by Substance and the memo.
+* memo.hits and memo.misses: lookups of helpers.memo.PropertyMemo.
+* rachford_rice: iterations and residual history of every solve.
+* flash.solve, adiabatic.solve, column.solve and flowsheet.solve: time and
+  iterations.
+
+Examples
+--------
+>>> from helpers import instrumentation
+>>> instrumentation.enable()
+>>> instrumentation.add_hook('http', lambda event: print(event))
+>>> flash.solve()
+>>> instrumentation.snapshot()['counters']['rachford_rice.iterations']
+3
+"""
+from collections import defaultdict
+from collections import deque
+import os
+import threading
+import time
+
+
+enabled = os.environ.get('IDEAL_DISTILLATION_INSTRUMENTATION') == '1'
+
+# Keeping the last residual histories of every solver
+HISTORY = 100
+
+clock = time.perf_counter
+
+lock = threading.Lock()
+counters = defaultdict(int)
+timers = {}
+histories = defaultdict(lambda: deque(maxlen=HISTORY))
+hooks = defaultdict(list)
+
+
+def enable():
+    """Start recording"""
+    global enabled
+    enabled = True
+
+
+def disable():
+    """Stop recording. The values recorded so far are kept"""
+    global enabled
+    enabled = False
+
+
+def reset():
+    """Forget every counter, timer and history. The hooks are kept"""
+    with lock:
+        counters.clear()
+        timers.clear()
+        histories.clear()
+
+
+def count(name, amount=1):
+    """Add amount to a counter"""
+    with lock:
+        counters[name] += amount
+
+
+def record(name, seconds, **data):
+    """Add a duration to a timer and call the hooks of the event.
+
+    Parameters
+    ----------
+    name : string
+        Name of the event.
+    seconds : float
+        Duration of the event.
+    data : dict
+        Details of the event passed to the hooks, i.e. bytes or iterations.
+    """
+    with lock:
+        timer = timers.get(name)
+        if timer is None:
+            timer = timers[name] = [0, 0.0, 0.0]
+        timer[0] += 1
+        timer[1] += seconds
+        timer[2] = max(timer[2], seconds)
+    emit(name, seconds=seconds, **data)
+
+
+def history(name, residuals):
+    """Keep the residual history of a solve and call the hooks of the
+    event"""
+    residuals = list(residuals)
+    with lock:
+        histories[name].append(residuals)
+        counters[name + '.solves'] += 1
+        counters[name + '.iterations'] += len(residuals)
+    emit(name, iterations=len(residuals), residuals=residuals)
+
+
+def emit(name, **data):
+    """Call the hooks of an event with a dict of its details"""
+    callbacks = hooks.get(name)
+    if not callbacks:
+        return
+    event = dict(data, name=name)
+    for callback in list(callbacks):
+        callback(event)
+
+
+def add_hook(name, callback):
+    """Call callback(event) on every event with this name"""
+    hooks[name].append(callback)
+
+
+def remove_hook(name, callback):
+    """Stop calling a callback added with add_hook()"""
+    if callback in hooks.get(name, []):
+        hooks[name].remove(callback)
+
+
+def snapshot():
+    """Copy the values recorded so far.
+
+    Returns
+    -------
+    dict
+        'counters' with name : value pairs, 'timers' with name : dict of
+        count, total, mean and max seconds, and 'histories' with name : list
+        of the last residual histories.
+    """
+    with lock:
+        return {
+            'counters': dict(counters),
+            'timers': {
+                name: {'count': n, 'total': total, 'mean': total / n,
+                       'max': longest}
+                for name, (n, total, longest) in timers.items()
+            },
+            'histories': {name: [list(residuals) for residuals in values]
+                          for name, values in histories.items()},
+        }
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""This module provides an in-memory memo of vapor pressures and K-values.
+
+Flash units and sweep points sharing conditions evaluate the same Antoine
+equations again and again. The memo keeps the results keyed by the Antoine
+table of the substance and plain numbers instead of Parameter objects:
+
+* (AntoineTable, T) -> vapor pressure in bar
+* (AntoineTable, T, P) -> Raoult's law K-value
+
+with T in K and P in bar. The entries live in one LRU cache of bounded size
+guarded by a lock, so the memo can be shared by threads. A lookup that hits
+skips the exponential entirely.
+
+The tables are compared by identity, so a substance given a new
+antoine_table gets new entries, and substances with the same tag but
+different tables never share them. Only after editing the coefficients of a
+table in place must the memo be cleared.
+
+Examples
+--------
+>>> from helpers import memo
+>>> memo.default_memo.vapor_pressures([propane, butane], 323.15)
+array([17.14,  4.99])
+>>> memo.default_memo.stats()['hits']
+0
+"""
+from collections import OrderedDict
+import os
+import threading
+
+import numpy as np
+
+from helpers import instrumentation
+
+
+DEFAULT_SIZE = 4096
+
+
+class LRUCache:
+    """Represents a thread-safe mapping that forgets the least recently used
+    entries beyond a size.
+
+    Attributes
+    ----------
+    maxsize : int
+        Maximum number of entries. None means there is no limit and 0 that
+        nothing is stored.
+    hits, misses, evictions : int
+        Statistics since the creation or the last clear().
+    """
+
+    def __init__(self, maxsize=DEFAULT_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        """Value of a key, or default if it is missing"""
+        return self.get_many([key], default)[0]
+
+    def set(self, key, value):
+        """Store a value, forgetting the oldest entries if needed"""
+        self.set_many([(key, value)])
+
+    def get_many(self, keys, default=None, count=True):
+        """Values of several keys taking the lock once.
+
+        Parameters
+        ----------
+        keys : iterable
+            The keys to look up.
+        default
+            Value of the missing keys.
+        count : bool
+            Add the lookups to hits and misses.
+
+        Returns
+        -------
+        list
+            Values ordered as keys, default where a key is missing.
+        """
+        values = []
+        with self.lock:
+            for key in keys:
+                value = self.entries.get(key, default)
+                if value is default:
+                    self.misses += count
+                else:
+                    self.hits += count
+                    self.entries.move_to_end(key)
+                values.append(value)
+        return values
+
+    def set_many(self, items):
+        """Store several key, value pairs taking the lock once"""
+        if self.maxsize == 0:
+            return
+        with self.lock:
+            for key, value in items:
+                self.entries[key] = value
+                self.entries.move_to_end(key)
+            self.shrink()
+
+    def resize(self, maxsize):
+        """Change the maximum number of entries"""
+        with self.lock:
+            self.maxsize = maxsize
+            self.shrink()
+
+    def shrink(self):
+        # The lock must be held
+        if self.maxsize is None:
+            return
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Forget every entry and reset the statistics"""
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Statistics of the cache.
+
+        Returns
+        -------
+        dict
+            'hits', 'misses', 'evictions', 'size', 'maxsize' and 'hit_rate'.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class PropertyMemo:
+    """Represents a memo of vapor pressures and K-values.
+
+    Attributes
+    ----------
+    cache : LRUCache
+        The entries of both properties.
+    """
+
+    def __init__(self, maxsize=DEFAULT_SIZE):
+        """Create a new PropertyMemo object
+
+        Parameters
+        ----------
+        maxsize : int
+            Maximum number of entries kept. None means there is no limit.
+        """
+        self.cache = LRUCache(maxsize)
+
+    def vapor_pressures(self, substances, temperature, count=True):
+        """Vapor pressures of substances at one temperature.
+
+        Parameters
+        ----------
+        substances : iterable
+            Substance objects.
+        temperature : float
+            Temperature in K.
+        count : bool
+            Add the lookups to the statistics. k_values() does not, so a
+            K-value miss counts as one miss.
+
+        Returns
+        -------
+        numpy.ndarray
+            Vapor pressures in bar ordered as substances.
+        """
+        temperature = float(temperature)
+        substances = list(substances)
+        values = self.cache.get_many(
+            [(substance.antoine_table, temperature)
+             for substance in substances], count=count)
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing:
+            for i in missing:
+                values[i] = substances[i].antoine_table.vapor_pressure(
+                    temperature)
+            self.cache.set_many(
+                [((substances[i].antoine_table, temperature), values[i])
+                 for i in missing])
+        if instrumentation.enabled:
+            instrumentation.count('psat.evaluations', len(missing))
+            if count:
+                instrumentation.count('memo.hits',
+                                      len(values) - len(missing))
+                instrumentation.count('memo.misses', len(missing))
+        return np.array(values, dtype=float)
+
+    def k_values(self, substances, temperature, pressure):
+        """Raoult's law K-values of substances.
+
+        Parameters
+        ----------
+        substances : iterable
+            Substance objects.
+        temperature : float
+            Temperature in K.
+        pressure : float
+            Pressure in bar.
+
+        Returns
+        -------
+        numpy.ndarray
+            K-values ordered as substances.
+        """
+        temperature = float(temperature)
+        pressure = float(pressure)
+        substances = list(substances)
+        values = self.cache.get_many(
+            [(substance.antoine_table, temperature, pressure)
+             for substance in substances])
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing:
+            Ps = self.vapor_pressures([substances[i] for i in missing],
+                                      temperature, count=False)
+            for i, K in zip(missing, (Ps / pressure).tolist()):
+                values[i] = K
+            self.cache.set_many(
+                [((substances[i].antoine_table, temperature, pressure),
+                  values[i])
+                 for i in missing])
+        if instrumentation.enabled:
+            instrumentation.count('memo.hits', len(values) - len(missing))
+            instrumentation.count('memo.misses', len(missing))
+        return np.array(values, dtype=float)
+
+    def clear(self):
+        """Forget every value, i.e. after editing the coefficients of an
+        AntoineTable in place"""
+        self.cache.clear()
+
+    def resize(self, maxsize):
+        """Change the maximum number of entries"""
+        self.cache.resize(maxsize)
+
+    def stats(self):
+        """Hit and miss statistics, see LRUCache.stats()"""
+        return self.cache.stats()
+
+
+# Memo used by every Flash unless another one is given. Its size comes from
+# the environment variable IDEAL_DISTILLATION_MEMO_SIZE. Setting it to None
+# makes Flash evaluate the vapor pressures every time.
+default_memo = PropertyMemo(
+    int(os.environ.get('IDEAL_DISTILLATION_MEMO_SIZE', DEFAULT_SIZE)))
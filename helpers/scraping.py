@@ -1,44 +1,92 @@
 from requests import get
+from requests import Session
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
+from urllib3.util.retry import Retry
 from contextlib import closing
+from importlib.util import find_spec
 from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
+from helpers import instrumentation
 
+# lxml builds the tree several times faster than the parser of the standard
+# library, but it is optional
+PARSER = 'lxml' if find_spec('lxml') is not None else 'html.parser'
 
-def get_html_bs4(url):
-    response = simple_get(url)
+
+def get_html(url, session=None):
+    response = simple_get(url, session)
 
     if response is not None:
-        return BeautifulSoup(response, 'html.parser')
+        return response
 
     raise Exception('Error retrieving contents at {}'.format(url))
 
 
-def scrap_properties(html_bs4, css_element, unique_property=None,
-                     property_value=None):
+def parse_html(content, parse_only=None):
+    """
+    Builds the BeautifulSoup tree of an HTML page. When `parse_only` is a
+    SoupStrainer, only the matching elements are built, which is much faster
+    and lighter than the whole tree.
+    """
+
+    return BeautifulSoup(content, PARSER, parse_only=parse_only)
+
+
+def parse_elements(content, name, attrs=None):
+    """
+    Builds only the elements `name` (with the attributes `attrs`) of an HTML
+    page and returns them as a list.
+    """
+
+    strainer = SoupStrainer(name, attrs=attrs or {})
+    return parse_html(content, strainer).find_all(name, attrs=attrs or {})
+
+
+def new_session(max_connections=10, retries=3, backoff=0.5):
+    """
+    Creates a requests Session whose keep-alive connections are shared by
+    every request made through it, even from several threads. Failed
+    connections and 429/5xx answers are retried with exponential backoff.
+    """
 
-    # Check given parameters
-    if unique_property is None or property_value is None:
-        return html_bs4.select_one(css_element)
-    else:
-        return html_bs4.find(css_element,
-                             attrs={unique_property: property_value})
+    retry = Retry(total=retries, backoff_factor=backoff,
+                  status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=('GET',))
+    adapter = HTTPAdapter(pool_connections=max_connections,
+                          pool_maxsize=max_connections, max_retries=retry)
+    session = Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
 
-def simple_get(url):
+def simple_get(url, session=None, timeout=None):
     """
     Attempts to get the content at `url` by making an HTTP GET request.
     If the content-type of response is some kind of HTML/XML, return the
-    text content, otherwise return None.
+    text content, otherwise return None. When a `session` is given its
+    pooled connections are used. `timeout` is the number of seconds to
+    wait for the server to connect or send data, None waits forever.
     """
 
+    request = get if session is None else session.get
+    start = instrumentation.clock() if instrumentation.enabled else None
     try:
-        with closing(get(url, stream=True)) as resp:
-            if is_good_response(resp):
-                return resp.content
-            else:
-                return None
+        with closing(request(url, stream=True, timeout=timeout)) as resp:
+            content = resp.content if is_good_response(resp) else None
+            if start is not None:
+                size = len(content) if content is not None else 0
+                instrumentation.count('http.requests')
+                instrumentation.count('http.bytes', size)
+                instrumentation.record('http', instrumentation.clock() - start,
+                                       url=url, status=resp.status_code,
+                                       bytes=size)
+            return content
 
     except RequestException as e:
+        if start is not None:
+            instrumentation.count('http.errors')
         log_error('Error during requests to {0} : {1}'.format(url, str(e)))
         return None
 
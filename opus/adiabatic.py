@@ -0,0 +1,290 @@
+from helpers.helpers import name_to_tag
+from helpers import converter
+from helpers import instrumentation
+from streams.parameter import Parameter
+from streams import enthalpy
+from opus import rachford_rice
+from opus.mixer import molar_flow
+import numpy as np
+
+
+class AdiabaticFlash:
+    """Represents a flash drum solved with an energy balance.
+
+    The feed is flashed to the pressure of the drum with a given heat duty
+    (zero for a valve or an adiabatic let-down drum), or with a given V/F,
+    in which case the duty is computed.
+
+    It is solved with the inside-out method of Boston and Britt. The outer
+    loop evaluates the rigorous properties at the current temperature: the
+    K-values from the vapor pressures and the component enthalpies from the
+    heat capacities and the heats of vaporization. From them it builds
+    simple models that are exact at that temperature: ln(K) linear in 1/T
+    with the Clausius-Clapeyron slope of every component, and enthalpies
+    linear in T. The inner loop solves the Rachford-Rice and energy balances
+    with these models only, and its temperature becomes the next point of
+    the outer loop. A solve usually needs three to five rigorous
+    evaluations.
+
+    Attributes
+    ----------
+    name : string
+        The name of the flash.
+    tag : string
+        The name of the flash as a return of name_to_tag().
+    inlet : Stream
+        Feed with temperature and pressure.
+    vapor, liquid : Stream
+        Products of the drum.
+    pressure : Parameter
+        Pressure of the drum. By default the pressure of the inlet.
+    duty : float
+        Heat added to the drum in kJ per hour. Computed when the V/F is
+        specified.
+    vapor_fraction : float
+        V/F after solve().
+    temperature : float
+        Temperature of the drum in K after solve().
+    phase : string
+        Phase of the products, as rachford_rice.classify().
+    iterations : int
+        Outer iterations of the last solve().
+    evaluations : int
+        Rigorous property evaluations of the last solve(), including the
+        one of the feed.
+    """
+
+    def __init__(self, name, inlet, vapor, liquid, pressure=None, duty=0.0):
+        self.name = name
+        self.tag = name_to_tag(name)
+        self.inlet = inlet
+        self.vapor = vapor
+        self.liquid = liquid
+        self.pressure = inlet.pressure if pressure is None else pressure
+        self.duty = duty
+        self.vapor_fraction = None
+        self.temperature = None
+        self.phase = None
+        self.iterations = 0
+        self.evaluations = 0
+
+    @property
+    def inlets(self):
+        """Streams entering the unit"""
+        return [self.inlet]
+
+    @property
+    def outlets(self):
+        """Streams leaving the unit"""
+        return [self.vapor, self.liquid]
+
+    def properties(self, temperature, pressure):
+        """Evaluate the rigorous properties at one temperature.
+
+        Parameters
+        ----------
+        temperature : float
+            Temperature in K.
+        pressure : Parameter
+            Pressure for the K-values.
+
+        Returns
+        -------
+        tuple
+            Arrays ordered as the inlet components: K-values, d ln(K)/dT,
+            vapor and liquid enthalpies (kJ/kmol) and their derivatives with
+            respect to T (kJ/kmol/K).
+        """
+        self.evaluations += 1
+        T = np.array([temperature])
+        components = self.inlet.components
+        Ps = np.array([substance.get_vapor_pressure_array(T)[0]
+                       for substance in components])
+        slopes = np.array([substance.antoine_table.log_slope_array(T)[0]
+                           for substance in components])
+        vapor = np.array([substance.get_vapor_enthalpy(T)[0]
+                          for substance in components])
+        latent = np.array([
+            enthalpy.vaporization_enthalpy(substance.antoine_table, T)[0]
+            for substance in components])
+        vapor_cp = np.array([
+            enthalpy.heat_capacity(substance.heat_capacity, temperature)
+            for substance in components])
+        latent_slope = np.array([
+            enthalpy.vaporization_enthalpy_slope(substance.antoine_table,
+                                                 T)[0]
+            for substance in components])
+
+        K = converter.pressure(Ps, 'bar', pressure.units) / pressure.value
+        return (K, slopes, vapor, vapor - latent, vapor_cp,
+                vapor_cp - latent_slope)
+
+    def feed_enthalpy(self):
+        """Enthalpy of the inlet at its temperature and pressure in kJ/kmol"""
+        temperature = converter.temperature(self.inlet.temperature.value,
+                                            self.inlet.temperature.units, 'k')
+        K, _, vapor, liquid, _, _ = self.properties(temperature,
+                                                    self.inlet.pressure)
+        return mixture_enthalpy(self.inlet.composition, K, vapor, liquid)[0]
+
+    def solve(self, vapor_fraction=None, tol=1e-8, maxiter=50):
+        """Solve the drum temperature and the products.
+
+        Parameters
+        ----------
+        vapor_fraction : float
+            V/F of the drum. When given the duty is computed, otherwise the
+            duty is used.
+        tol : float
+            Tolerance on the temperature in K.
+        maxiter : int
+            Maximum number of outer iterations.
+
+        Returns
+        -------
+        float
+            Temperature of the drum in K.
+        """
+        if self.inlet.pressure is None or self.inlet.temperature is None:
+            raise ValueError('The inlet of {} needs a temperature and a '
+                             'pressure'.format(self.name))
+
+        start = instrumentation.clock() if instrumentation.enabled else None
+        self.evaluations = 0
+        z = self.inlet.composition
+        feed = molar_flow(self.inlet)
+        inlet_enthalpy = self.feed_enthalpy()
+        if vapor_fraction is None:
+            target = inlet_enthalpy + (self.duty / feed if feed > 0 else 0)
+
+        temperature = converter.temperature(self.inlet.temperature.value,
+                                            self.inlet.temperature.units, 'k')
+        for iteration in range(1, maxiter + 1):
+            reference = temperature
+            K, slopes, vapor, liquid, vapor_cp, liquid_cp = \
+                self.properties(reference, self.pressure)
+
+            # ln(K) is linear in 1/T with the Clausius-Clapeyron slope
+            model = InsideOutModel(reference, np.log(K),
+                                   -reference**2 * slopes, vapor, liquid,
+                                   vapor_cp, liquid_cp)
+
+            if vapor_fraction is None:
+                temperature = model.solve_enthalpy(z, target, tol)
+            else:
+                temperature = model.solve_vapor_fraction(z, vapor_fraction,
+                                                         tol)
+
+            if abs(temperature - reference) < tol:
+                break
+        else:
+            raise RuntimeError('{} did not converge in {} iterations'
+                               .format(self.name, maxiter))
+
+        # The models are exact at the last rigorous point
+        r = rachford_rice.solve(z, K)
+        x, y = rachford_rice.compositions(r, z, K)
+        if vapor_fraction is not None:
+            outlet_enthalpy = mixture_enthalpy(z, K, vapor, liquid)[0]
+            self.duty = feed * (outlet_enthalpy - inlet_enthalpy)
+
+        self.phase = rachford_rice.classify(z, K)
+        self.vapor_fraction = r
+        self.temperature = reference
+        self.iterations = iteration
+        self.store(self.vapor, r, y)
+        self.store(self.liquid, 1 - r, x)
+
+        if start is not None:
+            instrumentation.record('adiabatic.solve',
+                                   instrumentation.clock() - start,
+                                   unit=self.tag, iterations=iteration,
+                                   evaluations=self.evaluations)
+        return reference
+
+    def store(self, stream, fraction, composition):
+        """Copy the results of a product into its stream"""
+        stream.flow_rate.name = self.inlet.flow_rate.name
+        stream.flow_rate.value = fraction * self.inlet.flow_rate.value
+        stream.flow_rate.units = self.inlet.flow_rate.units
+        if stream.components is self.inlet.components:
+            stream.composition[:] = composition
+        else:
+            stream.compositions = dict(zip(self.inlet.components.tags,
+                                           composition))
+        stream.temperature = Parameter('Temperature', self.temperature, 'K')
+        stream.pressure = Parameter(self.pressure.name, self.pressure.value,
+                                    self.pressure.units)
+
+
+class InsideOutModel:
+    """Approximate K-value and enthalpy models around a temperature T0.
+
+    ln(K_i) = a_i + b_i (1/T - 1/T0) and h_i = h_i(T0) + cp_i (T - T0) for
+    the vapor and the liquid, so the values and the slopes are exact at T0.
+    """
+
+    def __init__(self, reference, log_k, b, vapor, liquid, vapor_cp,
+                 liquid_cp):
+        self.reference = reference
+        self.log_k = log_k
+        self.b = b
+        self.vapor = vapor
+        self.liquid = liquid
+        self.vapor_cp = vapor_cp
+        self.liquid_cp = liquid_cp
+
+    def k_values(self, temperature):
+        return np.exp(self.log_k
+                      + self.b * (1 / temperature - 1 / self.reference))
+
+    def enthalpy(self, z, temperature):
+        """Enthalpy of the flashed feed in kJ/kmol"""
+        dT = temperature - self.reference
+        return mixture_enthalpy(z, self.k_values(temperature),
+                                self.vapor + self.vapor_cp * dT,
+                                self.liquid + self.liquid_cp * dT)[0]
+
+    def solve_enthalpy(self, z, target, tol, maxiter=100):
+        """Temperature where the flashed feed has the target enthalpy"""
+        temperature = self.reference
+        h = 1e-3
+        for _ in range(maxiter):
+            residual = self.enthalpy(z, temperature) - target
+            slope = (self.enthalpy(z, temperature + h)
+                     - self.enthalpy(z, temperature - h)) / (2 * h)
+            step = -residual / slope if slope > 0 else -np.sign(residual)
+            step = np.clip(step, -50, 50)
+            temperature = max(temperature + step, 1.0)
+            if abs(step) < 0.1 * tol:
+                break
+        return temperature
+
+    def solve_vapor_fraction(self, z, vapor_fraction, tol, maxiter=100):
+        """Temperature where the Rachford-Rice equation holds at the target
+        V/F"""
+        temperature = self.reference
+        for _ in range(maxiter):
+            K = self.k_values(temperature)
+            denominator = 1 + vapor_fraction * (K - 1)
+            residual = np.sum(z * (K - 1) / denominator)
+            slope = np.sum(z * K * -self.b / temperature**2
+                           / denominator**2)
+            step = np.clip(-residual / slope, -50, 50)
+            temperature = max(temperature + step, 1.0)
+            if abs(step) < 0.1 * tol:
+                break
+        return temperature
+
+
+def mixture_enthalpy(z, K, vapor, liquid):
+    """Enthalpy of a feed flashed with some K-values.
+
+    Returns
+    -------
+    tuple
+        Enthalpy in kJ/kmol of feed and the V/F.
+    """
+    r = rachford_rice.solve(z, K)
+    x, y = rachford_rice.compositions(r, z, K)
+    return r * (y @ vapor) + (1 - r) * (x @ liquid), r
@@ -0,0 +1,372 @@
+"""Phase envelopes and T-x-y / P-x-y diagrams traced by continuation.
+
+The bubble and dew curves of an ideal mixture are the solutions of one
+equation in two unknowns,
+
+    bubble: ln(sum(z K)) = 0        dew: ln(sum(z / K)) = 0
+
+with K = Psat(T) / P. Instead of solving flashes over a grid, each curve is
+followed with pseudo-arc-length continuation: from a point of the curve a
+predictor step goes along its tangent and a corrector brings it back to the
+curve with Newton iterations, keeping the step perpendicular to the tangent.
+The step grows where the curve is straight and shrinks where the corrector
+struggles, so every point comes from a warm start and a whole curve costs a
+few hundred evaluations.
+"""
+from helpers import converter
+import numpy as np
+
+
+BUBBLE = 'bubble'
+DEW = 'dew'
+
+
+class PhaseEnvelope:
+    """Traces the bubble and dew curves of the substances of a feed.
+
+    Attributes
+    ----------
+    feed : Stream
+        Stream with the substances and the composition of the mixture.
+    step : float
+        First arc-length step.
+    min_step, max_step : float
+        Limits of the arc-length step.
+    tol : float
+        Tolerance of the corrector on the residual.
+    max_points : int
+        Maximum number of points of a curve.
+    evaluations : int
+        Evaluations of the residual of the last curves traced.
+    iterations : int
+        Newton iterations of the last correction.
+    """
+
+    def __init__(self, feed, step=0.02, min_step=1e-5, max_step=0.1,
+                 tol=1e-10, max_points=1000):
+        self.feed = feed
+        self.step = step
+        self.min_step = min_step
+        self.max_step = max_step
+        self.tol = tol
+        self.max_points = max_points
+        self.evaluations = 0
+        self.iterations = 0
+
+    def temperature_range(self):
+        """Temperatures in K where every substance has Antoine data"""
+        tables = [substance.antoine_table
+                  for substance in self.feed.components]
+        low = max(table.edges[0] for table in tables)
+        high = min(table.edges[-1] for table in tables)
+        if low >= high:
+            low = min(table.edges[0] for table in tables)
+            high = max(table.edges[-1] for table in tables)
+        return low, high
+
+    def equilibrium(self, kind, z, dz, temperature, pressure):
+        """Evaluate the residual of a bubble or dew point and its gradient.
+
+        Parameters
+        ----------
+        kind : string
+            BUBBLE or DEW.
+        z : numpy.ndarray
+            Composition of the phase at its bubble or dew point.
+        dz : numpy.ndarray
+            Derivative of z along the path of compositions.
+        temperature : float
+            Temperature in K.
+        pressure : float
+            Pressure in bar.
+
+        Returns
+        -------
+        tuple
+            Residual, its gradient with respect to (path, ln T, ln P), and
+            the composition of the incipient phase.
+        """
+        self.evaluations += 1
+        T = np.array([temperature])
+        Ps = np.array([substance.get_vapor_pressure_array(T)[0]
+                       for substance in self.feed.components])
+        slopes = np.array([substance.antoine_table.log_slope_array(T)[0]
+                           for substance in self.feed.components])
+
+        if kind == BUBBLE:
+            terms = z * Ps / pressure
+            total = terms.sum()
+            gradient = np.array([(dz * Ps / pressure).sum() / total,
+                                 temperature * (terms * slopes).sum() / total,
+                                 -1.0])
+        else:
+            terms = z * pressure / Ps
+            total = terms.sum()
+            gradient = np.array([(dz * pressure / Ps).sum() / total,
+                                 -temperature * (terms * slopes).sum() / total,
+                                 1.0])
+        return np.log(total), gradient, terms / total
+
+    def envelope(self, pressures=None, units='kPa'):
+        """Trace the bubble and dew curves of the feed composition in the
+        pressure-temperature plane.
+
+        The curves start at the lowest temperature where every substance
+        has Antoine data and end at the highest one, or where the pressure
+        leaves the given limits.
+
+        Parameters
+        ----------
+        pressures : tuple
+            Lowest and highest pressures of the curves. Unlimited by default.
+        units : str
+            Units of the pressures, in the limits and the results.
+
+        Returns
+        -------
+        dict
+            BUBBLE and DEW curves, each one a dict with the arrays
+            'temperature' (K), 'pressure', 'x' and 'y' (points, components).
+        """
+        z = self.feed.composition / self.feed.composition.sum()
+        low, high = self.temperature_range()
+        if pressures is None:
+            pressures = (0, np.inf)
+        with np.errstate(divide='ignore'):
+            limits = np.log(converter.pressure(
+                np.asarray(pressures, dtype=float), units, 'bar'))
+        bounds = [(np.log(low), np.log(high)), tuple(limits)]
+
+        self.evaluations = 0
+        curves = {}
+        for kind in (BUBBLE, DEW):
+            def function(u, kind=kind):
+                T, P = np.exp(u)
+                g, gradient, _ = self.equilibrium(kind, z, 0 * z, T, P)
+                return g, gradient[1:]
+
+            start = self.correct(function, np.array([np.log(low), 0.0]),
+                                 fixed=0)
+            points = trace(function, start, np.array([1.0, 0.0]), bounds,
+                           self)
+
+            temperature, pressure = np.exp(points).T
+            curves[kind] = self.collect(
+                kind, np.broadcast_to(z, (len(points), len(z))), temperature,
+                pressure, units)
+        return curves
+
+    def txy(self, pressure, component=None):
+        """Trace the T-x-y diagram at a pressure.
+
+        For a binary the path goes from the pure second substance to the
+        pure first one. For more substances it goes from the feed without
+        the component to the pure component, keeping the ratios of the
+        others, which is a pseudo-binary of the component and the rest.
+
+        Parameters
+        ----------
+        pressure : Parameter
+            Pressure of the diagram.
+        component : str
+            Substance.tag of the component. By default the first substance.
+
+        Returns
+        -------
+        dict
+            BUBBLE and DEW curves, each one a dict with the arrays
+            'temperature' (K), 'pressure' (in the units of pressure), 'x' and
+            'y' (points, components) and 'fraction', the molar fraction of
+            the component in the liquid (bubble) or vapor (dew).
+        """
+        P = converter.pressure(pressure.value, pressure.units, 'bar')
+        low, high = self.temperature_range()
+        start = np.log(0.5 * (low + high))
+
+        def variables(u):
+            return np.exp(u[1]), P
+
+        return self.diagram(component, variables, start, pressure.units,
+                            np.array([1, 0]))
+
+    def pxy(self, temperature, component=None, units='kPa'):
+        """Trace the P-x-y diagram at a temperature.
+
+        The path of compositions is the one of txy().
+
+        Parameters
+        ----------
+        temperature : Parameter
+            Temperature of the diagram.
+        component : str
+            Substance.tag of the component. By default the first substance.
+        units : str
+            Units of the pressures of the results.
+
+        Returns
+        -------
+        dict
+            The same curves as txy().
+        """
+        T = converter.temperature(temperature.value, temperature.units, 'k')
+
+        def variables(u):
+            return T, np.exp(u[1])
+
+        return self.diagram(component, variables, 0.0, units,
+                            np.array([0, 1]))
+
+    def diagram(self, component, variables, start, units, coordinate):
+        """Trace the bubble and dew curves along the pseudo-binary path.
+
+        The continuation variables are the fraction of the component and the
+        logarithm of the temperature or pressure, given by variables(u) as
+        (T in K, P in bar). coordinate picks the entry of the gradient
+        (ln T, ln P) of that logarithm.
+        """
+        components = self.feed.components
+        index = 0 if component is None else components.index[component]
+        pure = np.eye(len(components))[index]
+        rest = self.feed.composition * (1 - pure)
+        if rest.sum() <= 0:
+            raise ValueError('The feed needs substances besides {}'
+                             .format(components.tags[index]))
+        rest = rest / rest.sum()
+        dz = pure - rest
+
+        self.evaluations = 0
+        curves = {}
+        for kind in (BUBBLE, DEW):
+            def function(u, kind=kind):
+                T, P = variables(u)
+                z = rest + u[0] * dz
+                g, gradient, _ = self.equilibrium(kind, z, dz, T, P)
+                return g, np.array([gradient[0], gradient[1:] @ coordinate])
+
+            first = self.correct(function, np.array([0.0, start]), fixed=0)
+            points = trace(function, first, np.array([1.0, 0.0]),
+                           [(0.0, 1.0), (-np.inf, np.inf)], self)
+
+            fraction = points[:, 0]
+            T, P = np.array([variables(u) for u in points]).T
+            z = rest + fraction[:, None] * dz
+            curves[kind] = self.collect(kind, z, T, P, units)
+            curves[kind]['fraction'] = fraction
+        return curves
+
+    def collect(self, kind, z, temperatures, pressures, units):
+        """Arrange the points of a curve with both phase compositions"""
+        incipient = np.array([
+            self.equilibrium(kind, zi, 0 * zi, T, P)[2]
+            for zi, T, P in zip(z, temperatures, pressures)])
+        x, y = (z, incipient) if kind == BUBBLE else (incipient, z)
+        return {
+            'temperature': np.asarray(temperatures, dtype=float),
+            'pressure': converter.pressure(
+                np.asarray(pressures, dtype=float), 'bar', units),
+            'x': np.array(x),
+            'y': np.array(y),
+        }
+
+    def correct(self, function, u, tangent=None, fixed=None, target=None):
+        """Bring a point back to the curve with Newton iterations.
+
+        The second equation keeps the correction perpendicular to the
+        tangent, or the coordinate fixed at its value in u.
+
+        Returns
+        -------
+        numpy.ndarray
+            The point on the curve, or None if the iterations fail.
+        """
+        predicted = u.copy()
+        for iteration in range(1, 9):
+            g, gradient = function(u)
+            if fixed is None:
+                second = tangent @ (u - predicted)
+                row = tangent
+            else:
+                second = u[fixed] - predicted[fixed]
+                row = np.eye(2)[fixed]
+            if abs(g) < self.tol and abs(second) < self.tol:
+                self.iterations = iteration - 1
+                return u
+
+            jacobian = np.array([gradient, row])
+            try:
+                u = u - np.linalg.solve(jacobian, [g, second])
+            except np.linalg.LinAlgError:
+                return None
+            if not np.all(np.isfinite(u)):
+                return None
+        return None
+
+
+def trace(function, start, direction, bounds, settings):
+    """Follow a curve g(u) = 0 in two variables by pseudo-arc-length
+    continuation.
+
+    Parameters
+    ----------
+    function : callable
+        function(u) returns g and its gradient with respect to u.
+    start : numpy.ndarray
+        First point, on the curve.
+    direction : numpy.ndarray
+        The first step goes along the tangent closer to this vector.
+    bounds : list
+        (lower, upper) limits of each variable. The last point lies on the
+        limit the curve crosses.
+    settings : PhaseEnvelope
+        step, min_step, max_step, max_points and correct().
+
+    Returns
+    -------
+    numpy.ndarray
+        Points of the curve with shape (points, 2).
+    """
+    lower = np.array([bound[0] for bound in bounds])
+    upper = np.array([bound[1] for bound in bounds])
+    points = [start]
+    u = start
+    step = settings.step
+    previous = direction
+
+    while len(points) < settings.max_points:
+        _, gradient = function(u)
+        tangent = np.array([-gradient[1], gradient[0]])
+        tangent /= np.linalg.norm(tangent)
+        if tangent @ previous < 0:
+            tangent = -tangent
+
+        predicted = u + step * tangent
+        crossed = np.nonzero((predicted < lower) | (predicted > upper))[0]
+        if crossed.size:
+            # Finish on the limit crossed with the coordinate fixed there
+            k = crossed[0]
+            limit = lower[k] if predicted[k] < lower[k] else upper[k]
+            fraction = (limit - u[k]) / (predicted[k] - u[k])
+            predicted = u + fraction * step * tangent
+            predicted[k] = limit
+            last = settings.correct(function, predicted, fixed=k)
+            if last is not None:
+                points.append(last)
+            break
+
+        corrected = settings.correct(function, predicted, tangent)
+        if corrected is None:
+            step /= 2
+            if step < settings.min_step:
+                break
+            continue
+
+        if settings.iterations <= 2:
+            step = min(1.5 * step, settings.max_step)
+        elif settings.iterations >= 5:
+            step = max(step / 2, settings.min_step)
+
+        points.append(corrected)
+        previous = tangent
+        u = corrected
+
+    return np.array(points)
@@ -1,35 +1,121 @@
 from helpers.helpers import name_to_tag
 from helpers import converter
-from scipy.optimize import newton
+from helpers import instrumentation
+from helpers import memo as property_memo
+from streams.parameter import Parameter
+from opus import rachford_rice
+from scipy.optimize import brentq
+import numpy as np
 
 class Flash:
-    
-    def __init__(self, name, inlet, vapor, liquid):
+
+    def __init__(self, name, inlet, vapor, liquid, memo=None):
         self.name = name
         self.tag = name_to_tag(name)
         self.inlet = inlet
         self.vapor = vapor
         self.liquid = liquid
+        self.vapor_fraction = None
+        self.phase = None
+
+        # PropertyMemo of the vapor pressures, helpers.memo.default_memo
+        # when None
+        self.memo = memo
+
+        # Inputs and partial results of the last solve. Only the parts whose
+        # inputs changed are computed again: the vapor pressures when the
+        # temperature changes, the K-values when the pressure changes and
+        # the Rachford-Rice solve when the K-values or the feed change.
+        self.temperature_state = None
+        self.vapor_pressures = None
+        self.pressure_state = None
+        self.K = None
+        self.solved_k = None
+        self.feed = None
+        self.x = None
+        self.y = None
+
+    def k_values(self):
+        """Compute the Raoult's law K-values of the inlet substances.
+
+        The vapor pressures are evaluated once at the inlet temperature, or
+        read from the PropertyMemo, and converted to the units of the inlet
+        pressure in a single call. They
+        are kept until the inlet temperature, the substances or their
+        AntoineTable change, and the K-values until the pressure changes too.
+
+        Returns
+        -------
+        numpy.ndarray
+            K-values ordered as inlet.components.
+        """
+        components = self.inlet.components
+        temperature = (self.inlet.temperature.value,
+                       self.inlet.temperature.units, components,
+                       tuple(substance.antoine_table
+                             for substance in components))
+        if temperature != self.temperature_state:
+            memo = self.memo if self.memo is not None \
+                else property_memo.default_memo
+            if memo is None:
+                self.vapor_pressures = np.array([
+                    substance.get_vapor_pressure(self.inlet.temperature)
+                    for substance in components
+                ])
+            else:
+                T = converter.temperature(self.inlet.temperature.value,
+                                          self.inlet.temperature.units, 'k')
+                self.vapor_pressures = memo.vapor_pressures(components, T)
+            self.temperature_state = temperature
+            self.pressure_state = None
+
+        pressure = (self.inlet.pressure.value, self.inlet.pressure.units)
+        if pressure != self.pressure_state:
+            Ps = converter.pressure(self.vapor_pressures, 'bar',
+                                    self.inlet.pressure.units)
+            self.K = Ps / self.inlet.pressure.value
+            self.pressure_state = pressure
+        return self.K
+
+    def invalidate(self):
+        """Forget the last solve, so the next one computes everything"""
+        self.temperature_state = None
+        self.pressure_state = None
+        self.solved_k = None
+        self.feed = None
+
+    @property
+    def inlets(self):
+        """Streams entering the unit"""
+        return [self.inlet]
+
+    @property
+    def outlets(self):
+        """Streams leaving the unit"""
+        return [self.vapor, self.liquid]
 
     def solve(self):
         if self.inlet.pressure != None and \
-            self.inlet.temperature != None and \
-            self.vapor.pressure == None and \
-            self.liquid.temperature == None:
-            
-            # r = v/f
-            def rachford_rice(r): 
-                sum = 0.0
-                for tag, substance in self.inlet.substances.items():
-                    Zi = self.inlet.compositions[tag]
-                    Ps = substance.get_vapor_pressure(self.inlet.temperature)
-                    Ps = converter.pressure(Ps, 'bar', 'kpa')
-                    Ki = Ps/self.inlet.pressure.value
-                    sum = sum + (Zi*(Ki-1)) / (1 + r*(Ki-1))
-                return sum
-
-            # solving r
-            r = newton(rachford_rice, 0.5)
+            self.inlet.temperature != None:
+
+            start = instrumentation.clock() if instrumentation.enabled \
+                else None
+            z = self.inlet.composition
+            K = self.k_values()
+
+            # Unchanged K-values and feed keep the last answer, otherwise the
+            # last V/F is the initial guess. Single-phase feeds skip the
+            # iteration, r = v/f is 0 or 1.
+            if K is not self.solved_k or not np.array_equal(z, self.feed):
+                self.phase = rachford_rice.classify(z, K)
+                guess = 0.5 if self.vapor_fraction is None \
+                    else self.vapor_fraction
+                self.vapor_fraction = rachford_rice.solve(z, K, guess)
+                self.x, self.y = rachford_rice.compositions(
+                    self.vapor_fraction, z, K)
+                self.solved_k = K
+                self.feed = z.copy()
+            r = self.vapor_fraction
 
             # Solving flow rates for vapor
             self.vapor.flow_rate.name = self.inlet.flow_rate.name
@@ -42,19 +128,341 @@ class Flash:
                                             - self.vapor.flow_rate.value
             self.liquid.flow_rate.units = self.inlet.flow_rate.units
 
-            # solving yi
-            for tag, substance in self.inlet.substances.items():
-                Zi = self.inlet.compositions[tag]
-                Ps = substance.get_vapor_pressure(self.inlet.temperature)
-                Ps = converter.pressure(Ps, 'bar', 'kpa')
-                Ki = Ps/self.inlet.pressure.value
-                self.vapor.compositions[tag] = Ki*Zi/(1 + (Ki-1)*r)
-
-            # solving xi
-            for tag, substance in self.inlet.substances.items():
-                Zi = self.inlet.compositions[tag]
-                Ps = substance.get_vapor_pressure(self.inlet.temperature)
-                Ps = converter.pressure(Ps, 'bar', 'kpa')
-                Ki = Ps/self.inlet.pressure.value
-                self.liquid.compositions[tag] = Zi/(1 + (Ki-1)*r)    
+            # The products are written on every solve, other units may have
+            # changed them since
+            self.store(self.vapor, self.y)
+            self.store(self.liquid, self.x)
+
+            # Both products leave at the conditions of the drum
+            self.store_conditions(self.vapor)
+            self.store_conditions(self.liquid)
+
+            if start is not None:
+                instrumentation.record('flash.solve',
+                                       instrumentation.clock() - start,
+                                       unit=self.tag, phase=self.phase,
+                                       vapor_fraction=r)
+
+    def sensitivities(self):
+        """Compute the analytic derivatives of the last solve().
+
+        The Rachford-Rice equation is differentiated implicitly at the
+        solution and chained with dK/dT = K dln(Psat)/dT, from the slope of
+        the Antoine equation, and dK/dP = -K/P. It needs no extra solves.
+
+        Returns
+        -------
+        dict
+            Derivatives of V/F ('dr_dT', 'dr_dP', 'dr_dz'), of the liquid
+            molar fractions ('dx_dT', 'dx_dP', 'dx_dz') and of the vapor
+            molar fractions ('dy_dT', 'dy_dP', 'dy_dz'), in the units of the
+            inlet temperature and pressure. The T and P derivatives of x and
+            y have shape (components,) and the z ones (components,
+            components), with [i, j] the derivative of component i with
+            respect to z_j. Every z is taken as independent.
+
+        Examples
+        --------
+        >>> flash.solve()
+        >>> flash.sensitivities()['dr_dT']
+        0.01407...
+        """
+        if self.vapor_fraction is None:
+            raise ValueError('{} must be solved before its sensitivities'
+                             .format(self.name))
+
+        units = self.inlet.temperature.units
+        temperature = converter.temperature(self.inlet.temperature.value,
+                                            units, 'k')
+        kelvin_per_unit = converter.factors('temperature', units, 'k')[0]
+        slopes = np.array([
+            substance.antoine_table.log_slope_array(temperature)
+            for substance in self.inlet.components
+        ])
+
+        K = self.k_values()
+        dK_dT = K * slopes * kelvin_per_unit
+        dK_dP = -K / self.inlet.pressure.value
+
+        result = rachford_rice.sensitivities(self.vapor_fraction,
+                                             self.inlet.composition, K)
+        return {
+            'dr_dT': float(result['dr_dK'] @ dK_dT),
+            'dr_dP': float(result['dr_dK'] @ dK_dP),
+            'dr_dz': result['dr_dz'],
+            'dx_dT': result['dx_dK'] @ dK_dT,
+            'dx_dP': result['dx_dK'] @ dK_dP,
+            'dx_dz': result['dx_dz'],
+            'dy_dT': result['dy_dK'] @ dK_dT,
+            'dy_dP': result['dy_dK'] @ dK_dP,
+            'dy_dz': result['dy_dz'],
+        }
+
+    def store(self, stream, composition):
+        """Copy a composition ordered as the inlet into an outlet stream"""
+        if stream.components is self.inlet.components:
+            stream.composition[:] = composition
+        else:
+            stream.compositions = dict(zip(self.inlet.components.tags,
+                                           composition))
+
+    def store_conditions(self, stream):
+        """Copy the inlet temperature and pressure into an outlet stream"""
+        for attribute in ('temperature', 'pressure'):
+            source = getattr(self.inlet, attribute)
+            target = getattr(stream, attribute)
+            if target is None or target is source:
+                setattr(stream, attribute,
+                        Parameter(source.name, source.value, source.units))
+            else:
+                target.value = source.value
+                target.units = source.units
+
+    def solve_spec(self, spec, target=None, component=None,
+                   variable='temperature', bracket=None, xtol=1e-8):
+        """Find the inlet temperature or pressure that meets a specification.
+
+        The specification is solved with Brent's method. When no bracket is
+        given it is searched starting from the current value of the variable,
+        so calling solve_spec() again after a small change starts from the
+        previous answer. The flash is left solved at the answer.
+
+        The available specifications are:
+
+        * 'vapor_fraction': V/F equal to target.
+        * 'liquid_composition' and 'vapor_composition': x or y of component
+          equal to target.
+        * 'liquid_flow' and 'vapor_flow': flow of component in the product
+          (or the whole product flow when component is None) equal to target,
+          in the units of the inlet flow rate.
+        * 'bubble_point' and 'dew_point': the target is not used.
+
+        Parameters
+        ----------
+        spec : string
+            Name of the specification.
+        target : float
+            Desired value of the specification.
+        component : string
+            Substance.tag the specification refers to.
+        variable : string
+            'temperature' or 'pressure'. The inlet parameter to change.
+        bracket : tuple
+            Lower and upper values of the variable enclosing the answer.
+        xtol : float
+            Absolute tolerance of the variable.
+
+        Returns
+        -------
+        float
+            The value of the variable, in the units of the inlet parameter.
+
+        Raises
+        ------
+        ValueError
+            If no bracket is given and the specification cannot be met
+            inside limits(). The variable keeps its value.
+
+        Examples
+        --------
+        Temperature of the main.py drum (200 kPa) for a liquid with 80 mol%
+        of n-hexane
+
+        >>> flash.solve_spec('liquid_composition', 0.80, 'hexane')
+        336.56
+        """
+        if variable not in ('temperature', 'pressure'):
+            raise ValueError('Unknown variable {}'.format(variable))
+        parameter = getattr(self.inlet, variable)
+        residual = self.spec_residual(spec, target, component)
+
+        def function(value):
+            parameter.value = value
+            if not np.all(np.isfinite(self.k_values())):
+                return np.nan
+            return residual()
+
+        if bracket is None:
+            start = parameter.value
+            try:
+                bracket = self.find_bracket(function, start, variable,
+                                            self.limits(variable))
+            except ValueError:
+                parameter.value = start
+                raise
+
+        value = bracket[0]
+        if bracket[0] != bracket[1]:
+            value = brentq(function, *bracket, xtol=xtol)
+        parameter.value = value
+        self.solve()
+        return value
+
+    def spec_residual(self, spec, target, component):
+        """Build a function returning the error of a specification at the
+        current inlet conditions. See solve_spec() for the options."""
+        if spec in ('bubble_point', 'dew_point'):
+            z = self.inlet.composition
+
+            # Bubble point: sum(z K) = 1, dew point: sum(z / K) = 1. The
+            # logarithm keeps the function close to linear in 1/T and ln P.
+            if spec == 'bubble_point':
+                return lambda: np.log(np.sum(z * self.k_values()))
+            return lambda: -np.log(np.sum(z / self.k_values()))
+
+        def value():
+            self.solve()
+            if spec == 'vapor_fraction':
+                return self.vapor_fraction
+            if spec == 'liquid_composition':
+                return self.liquid.compositions[component]
+            if spec == 'vapor_composition':
+                return self.vapor.compositions[component]
+            if spec in ('liquid_flow', 'vapor_flow'):
+                stream = self.liquid if spec == 'liquid_flow' else self.vapor
+                if component is None:
+                    return stream.flow_rate.value
+                return stream.flow_rate.value * stream.compositions[component]
+            raise ValueError('Unknown specification {}'.format(spec))
+
+        return lambda: value() - target
+
+    def limits(self, variable):
+        """Interval of the inlet temperature or pressure where a
+        specification is searched, in the units of the inlet parameter.
+
+        For the temperature it spans the Antoine ranges of the substances.
+        For the pressure it goes from the lowest to the highest vapor
+        pressure at the inlet temperature: below it the feed is all vapor
+        and above it all liquid, so no specification changes there.
+        """
+        if variable == 'temperature':
+            units = self.inlet.temperature.units
+            lower = min(substance.antoine_table.edges[0]
+                        for substance in self.inlet.components)
+            upper = max(substance.antoine_table.edges[-1]
+                        for substance in self.inlet.components)
+            return (float(converter.temperature(lower, 'k', units)),
+                    float(converter.temperature(upper, 'k', units)))
+
+        Ps = self.k_values() * self.inlet.pressure.value
+        Ps = Ps[np.isfinite(Ps) & (Ps > 0)]
+        if not Ps.size:
+            raise ValueError('The vapor pressures are not defined at the '
+                             'inlet temperature')
+        return float(Ps.min()), float(Ps.max())
+
+    @staticmethod
+    def find_bracket(function, start, variable, limits, maxiter=50):
+        """Search an interval around start where function changes its sign.
+
+        The interval grows geometrically in both directions: additive steps
+        from 1 unit for the temperature and multiplicative steps from 5 % for
+        the pressure, without leaving limits (extended to include start).
+        When the function is not defined at a trial point (NaN) the search
+        in that direction goes back halfway to the last valid point.
+
+        Raises
+        ------
+        ValueError
+            If the function does not change its sign inside limits.
+        """
+        f_start = function(start)
+        if f_start == 0:
+            return start, start
+        if np.isnan(f_start):
+            raise ValueError('The specification is not defined at {}'
+                             .format(start))
+
+        lower = min(limits[0], start)
+        upper = max(limits[1], start)
+
+        def move(step, sign):
+            if variable == 'temperature':
+                other = start + sign * step
+            else:
+                other = start * (1 + step) ** sign
+            return min(max(other, lower), upper)
+
+        steps = {1: 1.0, -1: 1.0} if variable == 'temperature' \
+            else {1: 0.05, -1: 0.05}
+        valid = {1: 0.0, -1: 0.0}
+        searching = [1, -1]
+        for _ in range(maxiter):
+            for sign in list(searching):
+                other = move(steps[sign], sign)
+                f_other = function(other)
+                if np.isnan(f_other):
+                    steps[sign] = 0.5 * (valid[sign] + steps[sign])
+                elif np.sign(f_other) != np.sign(f_start):
+                    return tuple(sorted((start, other)))
+                elif other in (lower, upper):
+                    searching.remove(sign)
+                else:
+                    valid[sign] = steps[sign]
+                    steps[sign] *= 2
+            if not searching:
+                break
+
+        raise ValueError('The specification cannot be met between {} and {}'
+                         .format(lower, upper))
+
+
+def solve_batch(substances, temperatures, pressures, compositions,
+                temperature_units='K', pressure_units='kPa'):
+    """Solve many isothermal flashes of the same substances in one call.
+
+    The temperatures, pressures and compositions are broadcast against each
+    other, so any of them can be given once for every case. The vapor
+    pressures are evaluated over the whole array of temperatures and the
+    Rachford-Rice equation is solved for all the cases simultaneously.
+
+    Parameters
+    ----------
+    substances : list
+        Substance objects of the feed.
+    temperatures : numpy.ndarray
+        Temperatures with shape (cases,).
+    pressures : numpy.ndarray
+        Pressures with shape (cases,).
+    compositions : numpy.ndarray
+        Feed molar fractions with shape (cases, components) or (components,).
+    temperature_units : str
+        Units of the temperatures.
+    pressure_units : str
+        Units of the pressures.
+
+    Returns
+    -------
+    tuple
+        Arrays of V/F with shape (cases,), x and y with shape
+        (cases, components).
+
+    Examples
+    --------
+    Sweeping the temperature of the main.py flash from 300 K to 340 K
+
+    >>> T = np.linspace(300, 340, 100000)
+    >>> r, x, y = solve_batch(substances, T, 200, [0.3, 0.1, 0.15, 0.45])
+    """
+    temperatures = converter.temperature(
+        np.asarray(temperatures, dtype=float), temperature_units, 'k')
+    pressures = np.asarray(pressures, dtype=float)
+    compositions = np.asarray(compositions, dtype=float)
+
+    shape = np.broadcast_shapes(np.shape(temperatures), np.shape(pressures),
+                                compositions.shape[:-1])
+    cases = int(np.prod(shape)) if shape else 1
+    temperatures = np.broadcast_to(temperatures, shape).reshape(cases)
+    pressures = np.broadcast_to(pressures, shape).reshape(cases)
+    compositions = np.broadcast_to(
+        compositions, shape + compositions.shape[-1:]).reshape(cases, -1)
+
+    Ps = np.column_stack([
+        substance.get_vapor_pressure_array(temperatures)
+        for substance in substances
+    ])
+    Ps = converter.pressure(Ps, 'bar', pressure_units)
+    K = Ps / pressures[:, None]
 
+    return rachford_rice.solve_many(compositions, K)
@@ -0,0 +1,451 @@
+from helpers.helpers import name_to_tag
+from helpers import instrumentation
+from helpers import converter
+from streams.parameter import Parameter
+import numpy as np
+
+
+class Flowsheet:
+    """Represents a process of units connected by streams.
+
+    The units are the nodes and the streams the edges: a stream in the
+    outlets of one unit and in the inlets of another connects them. Any
+    object with the attributes inlets and outlets and a solve() method can
+    be a unit, such as Flash, Column, Mixer and Splitter.
+
+    The calculation order comes from the strongly connected components of
+    the graph (Tarjan's algorithm) in topological order. A component of one
+    unit without a loop is solved once. In a component with recycles the
+    streams of the back edges of a depth-first search are torn, the rest of
+    the component is sorted and solved in that order, and the tear streams
+    are converged with Wegstein or Broyden acceleration.
+
+    The tear variables of a stream are the flow of every substance (the
+    flow rate times the molar fraction, in the units of the flow rate), the
+    temperature in K and the pressure in kPa. Units that replace the
+    temperature or pressure of a tear with one in other units do not change
+    the scale of the variables between passes.
+
+    Attributes
+    ----------
+    name : string
+        The name of the flowsheet.
+    tag : string
+        The name of the flowsheet as a return of name_to_tag().
+    units : list
+        The units of the process.
+    method : string
+        'wegstein', 'broyden' or 'direct' (successive substitution).
+    tol : float
+        Relative tolerance of the tear variables.
+    maxiter : int
+        Maximum number of passes through every loop.
+    blocks : list
+        (units, tears) pairs in the calculation order. units is the solve
+        order of a strongly connected component and tears its tear streams.
+    iterations : list
+        Passes of every block in the last solve().
+    """
+
+    def __init__(self, name, units, method='wegstein', tol=1e-6,
+                 maxiter=100):
+        if method not in ('wegstein', 'broyden', 'direct'):
+            raise ValueError('Unknown method {}'.format(method))
+        self.name = name
+        self.tag = name_to_tag(name)
+        self.units = list(units)
+        self.method = method
+        self.tol = tol
+        self.maxiter = maxiter
+        self.iterations = []
+        self.blocks = self.sequence()
+
+    @property
+    def order(self):
+        """Units in the calculation order"""
+        return [unit for units, _ in self.blocks for unit in units]
+
+    @property
+    def tears(self):
+        """Tear streams of every loop"""
+        return [stream for _, tears in self.blocks for stream in tears]
+
+    def edges(self):
+        """Find the connections between the units.
+
+        Returns
+        -------
+        dict
+            index of the unit : list of (index of the downstream unit,
+            stream) pairs, ordered as units.
+        """
+        consumers = {}
+        for j, unit in enumerate(self.units):
+            for stream in unit.inlets:
+                consumers.setdefault(id(stream), []).append(j)
+
+        edges = {i: [] for i in range(len(self.units))}
+        for i, unit in enumerate(self.units):
+            for stream in unit.outlets:
+                for j in consumers.get(id(stream), []):
+                    edges[i].append((j, stream))
+        return edges
+
+    def sequence(self):
+        """Compute the calculation blocks of the flowsheet"""
+        edges = self.edges()
+        blocks = []
+        for component in reversed(strongly_connected(edges)):
+            members = set(component)
+            inner = {i: [(j, stream) for j, stream in edges[i]
+                         if j in members] for i in component}
+            if len(component) == 1 and not inner[component[0]]:
+                blocks.append(([self.units[component[0]]], []))
+                continue
+
+            # Start the search at the units fed from outside the loop
+            produced = {id(stream) for i in component
+                        for _, stream in inner[i]}
+            starts = sorted(component, key=lambda i: (all(
+                id(stream) in produced for stream in self.units[i].inlets), i))
+            tears = back_edges(inner, starts)
+
+            torn = {id(stream) for stream in tears}
+            acyclic = {i: [(j, stream) for j, stream in inner[i]
+                           if id(stream) not in torn] for i in component}
+            order = topological(acyclic, sorted(component))
+            blocks.append(([self.units[i] for i in order],
+                           unique(stream for stream in tears)))
+        return blocks
+
+    def solve(self):
+        """Solve every unit of the flowsheet.
+
+        Returns
+        -------
+        int
+            Largest number of passes through a loop, 1 without recycles.
+        """
+        start = instrumentation.clock() if instrumentation.enabled else None
+        self.iterations = []
+        for units, tears in self.blocks:
+            if not tears:
+                for unit in units:
+                    unit.solve()
+                self.iterations.append(1)
+            else:
+                self.iterations.append(self.converge(units, tears))
+
+        if start is not None:
+            instrumentation.record('flowsheet.solve',
+                                   instrumentation.clock() - start,
+                                   flowsheet=self.tag,
+                                   iterations=list(self.iterations))
+        return max(self.iterations, default=0)
+
+    def converge(self, units, tears):
+        """Converge the tear streams of a loop.
+
+        Parameters
+        ----------
+        units : list
+            Units of the loop in solve order.
+        tears : list
+            Tear streams of the loop.
+
+        Returns
+        -------
+        int
+            Number of passes through the loop.
+        """
+        self.initialize(units, tears)
+
+        def passing(values):
+            store_tears(tears, values)
+            for unit in units:
+                unit.solve()
+            return tear_values(tears)
+
+        lower = tear_bounds(tears)
+        if self.method == 'wegstein':
+            accelerate = Wegstein(lower=lower)
+        elif self.method == 'broyden':
+            accelerate = Broyden(lower=lower)
+        else:
+            accelerate = None
+
+        values = tear_values(tears)
+        errors = [] if instrumentation.enabled else None
+        for iteration in range(1, self.maxiter + 1):
+            mapped = passing(values)
+            residual = mapped - values
+            error = np.max(np.abs(residual) / (1 + np.abs(mapped)))
+            if errors is not None:
+                errors.append(float(error))
+            if error <= self.tol:
+                if errors is not None:
+                    instrumentation.history('flowsheet', errors)
+                return iteration
+
+            if accelerate is None:
+                values = mapped
+            else:
+                values = accelerate.step(values, mapped)
+
+        raise RuntimeError('{} did not converge in {} iterations'
+                           .format(self.name, self.maxiter))
+
+    def initialize(self, units, tears):
+        """Give a temperature, pressure and composition to empty tears.
+
+        They are taken from the first stream that enters the loop from
+        outside with a known temperature and pressure.
+        """
+        produced = {id(stream) for unit in units for stream in unit.outlets}
+        feeds = [stream for unit in units for stream in unit.inlets
+                 if id(stream) not in produced and
+                 stream.temperature is not None and
+                 stream.pressure is not None]
+        if not feeds:
+            return
+
+        feed = feeds[0]
+        for stream in tears:
+            for attribute in ('temperature', 'pressure'):
+                if getattr(stream, attribute) is None:
+                    source = getattr(feed, attribute)
+                    setattr(stream, attribute, Parameter(
+                        source.name, source.value, source.units))
+            if not stream.composition.any():
+                if stream.components is feed.components:
+                    stream.composition[:] = feed.composition
+                else:
+                    stream.compositions = {
+                        tag: value for tag, value in feed.compositions.items()
+                        if tag in stream.components.index}
+
+
+class Wegstein:
+    """Bounded Wegstein acceleration of a fixed point x = g(x).
+
+    Every variable is extrapolated along the secant of its last two passes,
+    x = q x + (1 - q) g(x) with q = s / (s - 1) and s the slope of g. q is
+    bounded to [qmin, qmax], so the method never damps more than successive
+    substitution and never extrapolates wildly. The new values are kept
+    above lower, see tear_bounds().
+    """
+
+    def __init__(self, qmin=-5.0, qmax=0.0, delay=1, lower=None):
+        self.qmin = qmin
+        self.qmax = qmax
+        self.delay = delay
+        self.lower = lower
+        self.passes = 0
+        self.last_values = None
+        self.last_mapped = None
+
+    def step(self, values, mapped):
+        self.passes += 1
+        if self.passes <= self.delay or self.last_values is None:
+            new = mapped
+        else:
+            dx = values - self.last_values
+            dg = mapped - self.last_mapped
+            with np.errstate(divide='ignore', invalid='ignore'):
+                s = np.where(dx != 0, dg / dx, 0.0)
+                q = np.where(s != 1, s / (s - 1), self.qmin)
+            q = np.clip(np.nan_to_num(q), self.qmin, self.qmax)
+            new = q * values + (1 - q) * mapped
+
+        self.last_values = values
+        self.last_mapped = mapped
+        return clip_values(new, self.lower)
+
+
+class Broyden:
+    """Broyden's good method on the residual f(x) = g(x) - x.
+
+    The inverse Jacobian starts as -I, so the first step is a successive
+    substitution, and gets a rank one update after every pass. The new
+    values are kept above lower, see tear_bounds().
+    """
+
+    def __init__(self, lower=None):
+        self.lower = lower
+        self.inverse = None
+        self.last_values = None
+        self.last_residual = None
+
+    def step(self, values, mapped):
+        residual = mapped - values
+        if self.inverse is None:
+            self.inverse = -np.eye(len(values))
+        else:
+            dx = values - self.last_values
+            df = residual - self.last_residual
+            Hdf = self.inverse @ df
+            denominator = dx @ Hdf
+            if abs(denominator) > 1e-300:
+                self.inverse += np.outer(dx - Hdf, dx @ self.inverse) \
+                                / denominator
+
+        self.last_values = values
+        self.last_residual = residual
+        return clip_values(values - self.inverse @ residual, self.lower)
+
+
+def tear_values(tears):
+    """Pack the flows of every substance, temperature in K and pressure in
+    kPa of the tear streams into one array"""
+    values = []
+    for stream in tears:
+        values.append(stream.flow_rate.value * stream.composition)
+        values.append([
+            converter.temperature(stream.temperature.value,
+                                  stream.temperature.units, 'k'),
+            converter.pressure(stream.pressure.value, stream.pressure.units,
+                               'kPa')])
+    return np.concatenate(values)
+
+
+def store_tears(tears, values):
+    """Unpack the array of tear_values() into the tear streams"""
+    start = 0
+    for stream in tears:
+        n = len(stream.components)
+        flows = values[start:start + n]
+        total = flows.sum()
+        stream.flow_rate.value = total
+        if total > 0:
+            stream.composition[:] = flows / total
+        stream.temperature.value = converter.temperature(
+            values[start + n], 'k', stream.temperature.units)
+        stream.pressure.value = converter.pressure(
+            values[start + n + 1], 'kPa', stream.pressure.units)
+        start += n + 2
+
+
+def tear_bounds(tears):
+    """Lowest physical value of every entry of tear_values(): zero for the
+    flows, 0 K and 0 kPa"""
+    return np.zeros(sum(len(stream.components) + 2 for stream in tears))
+
+
+def clip_values(values, lower=None):
+    """Keep the accelerated values above their lower bounds. Without bounds
+    nothing is clipped"""
+    if lower is None:
+        return values
+    return np.maximum(values, lower)
+
+
+def strongly_connected(edges):
+    """Find the strongly connected components with Tarjan's algorithm.
+
+    Parameters
+    ----------
+    edges : dict
+        node : list of (node, label) pairs.
+
+    Returns
+    -------
+    list
+        Components as lists of nodes, in reverse topological order.
+    """
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    for root in edges:
+        if root in index:
+            continue
+        # Iterative depth-first search: (node, iterator over its edges)
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(edges[root]))]
+
+        while work:
+            node, children = work[-1]
+            for child, _ in children:
+                if child not in index:
+                    index[child] = lowlink[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(edges[child])))
+                    break
+                if child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(sorted(component))
+    return components
+
+
+def back_edges(edges, starts):
+    """Find the labels of the edges that close a cycle in a depth-first
+    search started from every node of starts in turn"""
+    state = {}
+    found = []
+    for root in starts:
+        if root in state:
+            continue
+        state[root] = 'open'
+        work = [(root, iter(edges[root]))]
+        while work:
+            node, children = work[-1]
+            for child, label in children:
+                if child not in state:
+                    state[child] = 'open'
+                    work.append((child, iter(edges[child])))
+                    break
+                if state[child] == 'open':
+                    found.append(label)
+            else:
+                state[node] = 'closed'
+                work.pop()
+    return found
+
+
+def topological(edges, nodes):
+    """Sort the nodes of an acyclic graph, keeping the order of nodes
+    between independent ones"""
+    incoming = {node: 0 for node in nodes}
+    for node in nodes:
+        for child, _ in edges[node]:
+            incoming[child] += 1
+
+    ready = [node for node in nodes if incoming[node] == 0]
+    order = []
+    while ready:
+        node = ready.pop(0)
+        order.append(node)
+        for child, _ in edges[node]:
+            incoming[child] -= 1
+            if incoming[child] == 0:
+                ready.append(child)
+    return order
+
+
+def unique(streams):
+    """Drop the repeated streams keeping the first appearance"""
+    seen = set()
+    result = []
+    for stream in streams:
+        if id(stream) not in seen:
+            seen.add(id(stream))
+            result.append(stream)
+    return result
@@ -0,0 +1,212 @@
+"""Lazy sweeps of flashes over iterables of inlet conditions.
+
+The functions of this module are generators: a case is only read from the
+inputs and solved when the consumer asks for the next result, so the inputs
+can be generators longer than the memory, the consumer can start working on
+the first results right away, and a consumer that stops (or breaks out of a
+loop) leaves the rest of the cases unsolved. A slow consumer is the
+backpressure, nothing is solved ahead of it except the batches a
+SweepExecutor keeps in its pool.
+
+The results are dicts of columns, the same as opus.results, so they can be
+passed on to a ResultsWriter.
+
+Examples
+--------
+First temperature where half of the feed is vaporized, stopping there
+
+>>> first(flashes(flash, temperatures=np.arange(300, 400, 0.01)),
+          lambda row: row['vapor_fraction'] >= 0.5)
+
+Monte Carlo study in chunks of 10000 cases, written to disk as they come
+
+>>> temperatures = (rng.normal(323, 5) for _ in range(10**8))
+>>> with ResultsWriter('study.npz') as writer:
+        for chunk in batches(substances, temperatures, 200, composition,
+                             chunk_size=10000):
+            writer.write(chunk)
+"""
+from collections import deque
+from collections.abc import Iterable
+from itertools import islice
+from itertools import repeat
+import numbers
+
+import numpy as np
+
+from opus import results
+from opus.flash import solve_batch
+
+
+def cases(temperatures=None, pressures=None, compositions=None):
+    """Combine the inlet conditions of a sweep lazily.
+
+    Every argument is either an iterable with one value per case or one
+    value for every case (a number for the temperature and pressure, a list
+    of molar fractions for the composition). The sweep ends with the
+    shortest iterable.
+
+    Yields
+    ------
+    tuple
+        Temperature, pressure and composition of every case. None where the
+        argument was not given.
+    """
+    constant = (
+        not isinstance(temperatures, Iterable),
+        not isinstance(pressures, Iterable),
+        is_composition(compositions),
+    )
+    values = [repeat(value) if fixed else value for value, fixed in
+              zip((temperatures, pressures, compositions), constant)]
+    if all(constant):
+        return zip(*(islice(value, 1) for value in values))
+    return zip(*values)
+
+
+def is_composition(values):
+    """Whether values are the molar fractions of one case (or None)"""
+    if values is None or isinstance(values, dict):
+        return True
+    if isinstance(values, np.ndarray):
+        return values.ndim == 1
+    return isinstance(values, (list, tuple)) and len(values) > 0 and \
+        isinstance(values[0], numbers.Number)
+
+
+def flashes(flash, temperatures=None, pressures=None, compositions=None):
+    """Solve a Flash for every case of a sweep, one at a time.
+
+    The inlet of the flash is changed in place, in the units of its
+    parameters, and left at the last case solved. Conditions that are not
+    given keep the value of the inlet. Every solve starts from the previous
+    one, see Flash.solve().
+
+    Parameters
+    ----------
+    flash : Flash
+        The flash to solve.
+    temperatures, pressures, compositions
+        Conditions of the cases, see cases().
+
+    Yields
+    ------
+    dict
+        Row of every case, see opus.results.flash_columns().
+    """
+    inlet = flash.inlet
+    for temperature, pressure, composition in cases(
+            temperatures, pressures, compositions):
+        if temperature is not None:
+            inlet.temperature.value = temperature
+        if pressure is not None:
+            inlet.pressure.value = pressure
+        if composition is not None:
+            inlet.compositions = composition
+        flash.solve()
+        yield results.flash_columns(flash)
+
+
+def batches(substances, temperatures, pressures, compositions,
+            chunk_size=1024, temperature_units='K', pressure_units='kPa',
+            executor=None, max_pending=None):
+    """Solve a sweep of isothermal flashes in chunks of cases.
+
+    Only chunk_size cases are read from the inputs at a time and solved with
+    opus.flash.solve_batch(), or in the pool of a SweepExecutor of the same
+    substances, which solves up to max_pending chunks ahead of the consumer.
+
+    Parameters
+    ----------
+    substances : list
+        Substance objects of the feed.
+    temperatures, pressures, compositions
+        Conditions of the cases, see cases(). Compositions given as dicts
+        are Substance.tag : molar fraction, the substances left out have
+        none. There is no inlet to take a composition from, so None is not
+        allowed.
+    chunk_size : int
+        Cases per chunk. The last chunk can be shorter.
+    temperature_units : str
+        Units of the temperatures.
+    pressure_units : str
+        Units of the pressures.
+    executor : SweepExecutor
+        Pool to solve the chunks in. By default they are solved in this
+        process.
+    max_pending : int
+        Chunks solved ahead of the consumer, see SweepExecutor.imap().
+
+    Yields
+    ------
+    dict
+        Columns of every chunk with the conditions in K and kPa, see
+        opus.results.batch_columns().
+
+    Raises
+    ------
+    ValueError
+        If a composition is None or has a tag of another substance.
+    """
+    if compositions is None:
+        raise ValueError('batches() needs the compositions of the cases')
+    iterator = cases(temperatures, pressures, compositions)
+    conditions = deque()
+
+    def chunks():
+        while True:
+            chunk = list(islice(iterator, chunk_size))
+            if not chunk:
+                return
+            T, P, z = zip(*chunk)
+            T = np.array(T, dtype=float)
+            P = np.array(P, dtype=float)
+            z = np.array([composition_array(substances, value)
+                          for value in z])
+            conditions.append((T, P))
+            yield T, P, z
+
+    if executor is None:
+        solved = (solve_batch(substances, T, P, z, temperature_units,
+                              pressure_units) for T, P, z in chunks())
+    else:
+        solved = executor.imap(chunks(), temperature_units, pressure_units,
+                               max_pending)
+
+    for r, x, y in solved:
+        T, P = conditions.popleft()
+        yield results.batch_columns(substances, r, x, y, T, P,
+                                    temperature_units, pressure_units)
+
+
+def composition_array(substances, composition):
+    """Molar fractions ordered as substances from a list or a dict by tag"""
+    if composition is None:
+        raise ValueError('batches() needs the compositions of the cases')
+    if not isinstance(composition, dict):
+        return np.asarray(composition, dtype=float)
+    tags = [substance.tag for substance in substances]
+    unknown = set(composition) - set(tags)
+    if unknown:
+        raise ValueError('{} are not substances of the batch'
+                         .format(', '.join(sorted(unknown))))
+    return np.array([composition.get(tag, 0.0) for tag in tags],
+                    dtype=float)
+
+
+def rows(chunks):
+    """Split chunks of columns into rows, one dict per case"""
+    for chunk in chunks:
+        names = list(chunk)
+        for values in zip(*(np.asarray(chunk[name]).tolist()
+                            for name in names)):
+            yield dict(zip(names, values))
+
+
+def first(items, predicate):
+    """First item meeting a predicate, or None. The rest of the items are
+    not generated"""
+    for item in items:
+        if predicate(item):
+            return item
+    return None
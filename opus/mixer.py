@@ -0,0 +1,138 @@
+from helpers.helpers import name_to_tag
+from helpers import converter
+from streams.parameter import Parameter
+import numpy as np
+
+
+class Mixer:
+    """Represents the mixing of several streams into one.
+
+    The component balances are made in kmol/h and the outlet keeps the units
+    of its flow rate. The outlet temperature is the molar flow average of
+    the inlet temperatures, which is exact for substances with equal heat
+    capacities, and the outlet pressure is the lowest inlet pressure.
+
+    Attributes
+    ----------
+    name : string
+        The name of the mixer.
+    tag : string
+        The name of the mixer as a return of name_to_tag().
+    inlets : list
+        Streams to mix.
+    outlet : Stream
+        The mixed stream, with the substances of the inlets.
+    """
+
+    def __init__(self, name, inlets, outlet):
+        self.name = name
+        self.tag = name_to_tag(name)
+        self.inlets = list(inlets)
+        self.outlet = outlet
+
+    @property
+    def outlets(self):
+        """Streams leaving the unit"""
+        return [self.outlet]
+
+    def solve(self):
+        index = self.outlet.components.index
+        flows = np.zeros(len(self.outlet.components))
+        temperatures = []
+        pressures = []
+
+        for stream in self.inlets:
+            flow = molar_flow(stream)
+            if stream.components is self.outlet.components:
+                flows += flow * stream.composition
+            else:
+                for tag, fraction in stream.compositions.items():
+                    flows[index[tag]] += flow * fraction
+
+            if stream.temperature is not None:
+                temperatures.append((flow, converter.temperature(
+                    stream.temperature.value, stream.temperature.units, 'K')))
+            if stream.pressure is not None:
+                pressures.append(converter.pressure(
+                    stream.pressure.value, stream.pressure.units, 'kPa'))
+
+        total = flows.sum()
+        if total > 0:
+            self.outlet.composition[:] = flows / total
+
+        units = self.outlet.flow_rate.units
+        self.outlet.flow_rate.value = converter.flow_rate(
+            total, self.outlet.substances, self.outlet.compositions,
+            'kmol/h', units)
+
+        if temperatures:
+            weights, values = np.array(temperatures).T
+            if weights.sum() > 0:
+                value = np.average(values, weights=weights)
+            else:
+                value = values.mean()
+            self.outlet.temperature = Parameter('Temperature', value, 'K')
+        if pressures:
+            self.outlet.pressure = Parameter('Pressure', min(pressures), 'kPa')
+
+
+class Splitter:
+    """Represents the split of a stream into several of the same composition.
+
+    Attributes
+    ----------
+    name : string
+        The name of the splitter.
+    tag : string
+        The name of the splitter as a return of name_to_tag().
+    inlet : Stream
+        The stream to split.
+    outlets : list
+        The streams leaving the splitter.
+    fractions : list
+        Fraction of the inlet flow that leaves in every outlet. They must add
+        up to 1.
+    """
+
+    def __init__(self, name, inlet, outlets, fractions):
+        if len(outlets) != len(fractions):
+            raise ValueError('A splitter needs one fraction per outlet')
+        if abs(sum(fractions) - 1) > 1e-9:
+            raise ValueError('The split fractions must add up to 1')
+
+        self.name = name
+        self.tag = name_to_tag(name)
+        self.inlet = inlet
+        self.outlets = list(outlets)
+        self.fractions = list(fractions)
+
+    @property
+    def inlets(self):
+        """Streams entering the unit"""
+        return [self.inlet]
+
+    def solve(self):
+        for stream, fraction in zip(self.outlets, self.fractions):
+            if stream.components is self.inlet.components:
+                stream.composition[:] = self.inlet.composition
+            else:
+                stream.compositions = dict(self.inlet.compositions)
+
+            stream.flow_rate.name = self.inlet.flow_rate.name
+            stream.flow_rate.value = fraction * self.inlet.flow_rate.value
+            stream.flow_rate.units = self.inlet.flow_rate.units
+
+            for attribute in ('temperature', 'pressure'):
+                source = getattr(self.inlet, attribute)
+                if source is not None:
+                    setattr(stream, attribute, Parameter(
+                        source.name, source.value, source.units))
+
+
+def molar_flow(stream):
+    """Flow rate of a stream in kmol/h"""
+    if stream.flow_rate.units == 'kmol/h':
+        return stream.flow_rate.value
+    return converter.flow_rate(stream.flow_rate.value, stream.substances,
+                               stream.compositions, stream.flow_rate.units,
+                               'kmol/h')
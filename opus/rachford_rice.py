@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""This module provides the Rachford-Rice equation as NumPy array operations.
+
+Every function receives the feed compositions z and the K-values K as arrays
+with one item per component, so the K-values are computed once per solve and
+each Newton iteration costs a couple of array operations.
+
+Before iterating, the feed is classified with the bubble point and dew point
+tests: if sum(z K) <= 1 the feed is a subcooled liquid (V/F = 0) and if
+sum(z / K) <= 1 it is a superheated vapor (V/F = 1). Only two-phase feeds are
+iterated, with Newton steps kept inside a bracket that shrinks on every
+iteration, so the solve always converges to a V/F in [0, 1].
+"""
+from helpers import instrumentation
+import numpy as np
+
+
+LIQUID = 'liquid'
+TWO_PHASE = 'two-phase'
+VAPOR = 'vapor'
+
+
+def residual(r, z, K):
+    """Evaluate the Rachford-Rice function.
+
+    Parameters
+    ----------
+    r : float
+        Vapor fraction V/F.
+    z : numpy.ndarray
+        Feed molar fractions.
+    K : numpy.ndarray
+        K-values of the components.
+
+    Returns
+    -------
+    float
+        sum(z_i (K_i - 1) / (1 + r (K_i - 1)))
+    """
+    Km1 = K - 1
+    return np.sum(z * Km1 / (1 + r * Km1))
+
+
+def derivative(r, z, K):
+    """Evaluate the analytic derivative of the Rachford-Rice function with
+    respect to the vapor fraction.
+
+    Parameters
+    ----------
+    r : float
+        Vapor fraction V/F.
+    z : numpy.ndarray
+        Feed molar fractions.
+    K : numpy.ndarray
+        K-values of the components.
+
+    Returns
+    -------
+    float
+        -sum(z_i (K_i - 1)^2 / (1 + r (K_i - 1))^2)
+    """
+    Km1 = K - 1
+    return -np.sum(z * Km1**2 / (1 + r * Km1)**2)
+
+
+def classify(z, K):
+    """Classify the phase of a feed without iterating.
+
+    Parameters
+    ----------
+    z : numpy.ndarray
+        Feed molar fractions. One case per row when it is two-dimensional.
+    K : numpy.ndarray
+        K-values of the components with the same shape as z.
+
+    Returns
+    -------
+    str
+        LIQUID, TWO_PHASE or VAPOR. An array of them for two-dimensional
+        inputs.
+    """
+    bubble = np.sum(z * K, axis=-1)
+    dew = np.sum(z / K, axis=-1)
+    return np.where(bubble <= 1, LIQUID,
+                    np.where(dew <= 1, VAPOR, TWO_PHASE))[()]
+
+
+def bracket(K):
+    """Compute the interval of V/F where a two-phase root can be.
+
+    The Rachford-Rice function has its asymptotes at 1 / (1 - K_max) and
+    1 / (1 - K_min). For a two-phase feed the root lies between them and
+    inside [0, 1].
+
+    Parameters
+    ----------
+    K : numpy.ndarray
+        K-values of the components. One case per row when it is
+        two-dimensional.
+
+    Returns
+    -------
+    tuple
+        Lower and upper limits of V/F.
+    """
+    with np.errstate(divide='ignore'):
+        lower = 1 / (1 - np.max(K, axis=-1))
+        upper = 1 / (1 - np.min(K, axis=-1))
+    return np.clip(lower, 0, 1), np.clip(upper, 0, 1)
+
+
+def solve(z, K, guess=0.5, tol=1e-10, maxiter=100):
+    """Solve the Rachford-Rice equation for the vapor fraction.
+
+    Single-phase feeds return right away. Two-phase feeds are solved with
+    Newton steps using the analytic derivative, replaced by a bisection when
+    a step leaves the bracket.
+
+    Parameters
+    ----------
+    z : numpy.ndarray
+        Feed molar fractions.
+    K : numpy.ndarray
+        K-values of the components.
+    guess : float
+        Initial value of V/F.
+    tol : float
+        Tolerance on the change of V/F between iterations.
+    maxiter : int
+        Maximum number of iterations.
+
+    Returns
+    -------
+    float
+        The vapor fraction V/F.
+    """
+    phase = classify(z, K)
+    if phase == LIQUID:
+        return 0.0
+    if phase == VAPOR:
+        return 1.0
+
+    Km1 = K - 1
+    lower, upper = bracket(K)
+    r = guess if lower < guess < upper else 0.5 * (lower + upper)
+    residuals = [] if instrumentation.enabled else None
+
+    for _ in range(maxiter):
+        denominator = 1 + r * Km1
+        terms = z * Km1 / denominator
+        f = terms.sum()
+        df = -(terms * Km1 / denominator).sum()
+        if residuals is not None:
+            residuals.append(float(f))
+
+        # The residual decreases with r
+        if f > 0:
+            lower = r
+        else:
+            upper = r
+
+        step = r - f / df if df != 0 else lower
+        if not lower < step < upper:
+            step = 0.5 * (lower + upper)
+
+        if abs(step - r) <= tol:
+            r = step
+            break
+        r = step
+
+    if residuals is not None:
+        instrumentation.history('rachford_rice', residuals)
+    return r
+
+
+def compositions(r, z, K):
+    """Compute the liquid and vapor molar fractions for a given V/F.
+
+    For a single-phase feed the composition of the missing phase is the one
+    of its first bubble or drop.
+
+    Parameters
+    ----------
+    r : float
+        Vapor fraction V/F.
+    z : numpy.ndarray
+        Feed molar fractions.
+    K : numpy.ndarray
+        K-values of the components.
+
+    Returns
+    -------
+    tuple
+        Arrays x (liquid) and y (vapor) of molar fractions.
+    """
+    x = z / (1 + r * (K - 1))
+    y = K * x
+    return x / x.sum(axis=-1, keepdims=True), y / y.sum(axis=-1, keepdims=True)
+
+
+def sensitivities(r, z, K):
+    """Compute the derivatives of a solved flash with respect to the
+    K-values and the feed molar fractions.
+
+    The derivatives of V/F come from the implicit function theorem on the
+    Rachford-Rice equation, dr = -(dF/dK dK + dF/dz dz) / (dF/dr), and the
+    ones of the compositions from differentiating compositions(), including
+    the normalization. For a single-phase feed V/F stays at 0 or 1. Every z
+    is taken as independent, so dz need not add up to zero.
+
+    Parameters
+    ----------
+    r : float
+        Vapor fraction V/F at the solution.
+    z : numpy.ndarray
+        Feed molar fractions.
+    K : numpy.ndarray
+        K-values of the components.
+
+    Returns
+    -------
+    dict
+        'dr_dK' and 'dr_dz' with shape (components,); 'dx_dK', 'dx_dz',
+        'dy_dK' and 'dy_dz' with shape (components, components), where the
+        item [i, j] is the derivative of component i with respect to j.
+    """
+    z = np.asarray(z, dtype=float)
+    K = np.asarray(K, dtype=float)
+    Km1 = K - 1
+    denominator = 1 + r * Km1
+    identity = np.eye(len(z))
+
+    if classify(z, K) == TWO_PHASE:
+        slope = derivative(r, z, K)
+        dr_dK = -(z / denominator**2) / slope
+        dr_dz = -(Km1 / denominator) / slope
+    else:
+        dr_dK = np.zeros_like(z)
+        dr_dz = np.zeros_like(z)
+
+    # Unnormalized x = z / (1 + r (K - 1)) and y = K x
+    x = z / denominator
+    y = K * x
+    factor = -(z / denominator**2)[:, None]
+    dx_dK = factor * (Km1[:, None] * dr_dK[None, :] + r * identity)
+    dx_dz = identity / denominator[:, None] \
+        + factor * Km1[:, None] * dr_dz[None, :]
+    dy_dK = K[:, None] * dx_dK + identity * x[:, None]
+    dy_dz = K[:, None] * dx_dz
+
+    return {
+        'dr_dK': dr_dK,
+        'dr_dz': dr_dz,
+        'dx_dK': normalized(x, dx_dK),
+        'dx_dz': normalized(x, dx_dz),
+        'dy_dK': normalized(y, dy_dK),
+        'dy_dz': normalized(y, dy_dz),
+    }
+
+
+def normalized(values, jacobian):
+    """Jacobian of values / sum(values) from the Jacobian of values"""
+    total = values.sum()
+    return (jacobian - np.outer(values / total, jacobian.sum(axis=0))) / total
+
+
+def solve_many(z, K, tol=1e-10, maxiter=100):
+    """Solve the Rachford-Rice equation for many cases at once.
+
+    Every row is an independent case. The rows are classified first and only
+    the two-phase ones are iterated, all of them simultaneously, with Newton
+    steps kept inside a bracket of V/F that shrinks on every iteration. A
+    step falling outside the bracket is replaced with a bisection, so every
+    row converges.
+
+    Parameters
+    ----------
+    z : numpy.ndarray
+        Feed molar fractions with shape (cases, components).
+    K : numpy.ndarray
+        K-values with shape (cases, components).
+    tol : float
+        Tolerance on the change of V/F between iterations.
+    maxiter : int
+        Maximum number of iterations.
+
+    Returns
+    -------
+    tuple
+        Arrays r with shape (cases,), x and y with shape (cases, components).
+    """
+    z = np.atleast_2d(z)
+    K = np.atleast_2d(K)
+    Km1 = K - 1
+
+    phase = classify(z, K)
+    lower, upper = bracket(K)
+    r = np.where(phase == VAPOR, 1.0, 0.0)
+    active = np.nonzero(phase == TWO_PHASE)[0]
+    r[active] = 0.5 * (lower[active] + upper[active])
+    residuals = [] if instrumentation.enabled else None
+
+    for _ in range(maxiter):
+        if active.size == 0:
+            break
+
+        zi, Ki, ri = z[active], Km1[active], r[active]
+        denominator = 1 + ri[:, None] * Ki
+        terms = zi * Ki / denominator
+        f = terms.sum(axis=1)
+        df = -(terms * Ki / denominator).sum(axis=1)
+        if residuals is not None:
+            residuals.append(float(np.abs(f).max()))
+
+        # Shrinking the bracket around the root
+        above = f > 0
+        lo = np.where(above, ri, lower[active])
+        hi = np.where(above, upper[active], ri)
+        lower[active] = lo
+        upper[active] = hi
+
+        # Newton step, or bisection when it leaves the bracket
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = ri - f / df
+        outside = ~((step > lo) & (step < hi))
+        step = np.where(outside, 0.5 * (lo + hi), step)
+
+        r[active] = step
+        active = active[np.abs(step - ri) > tol]
+
+    if residuals is not None:
+        instrumentation.history('rachford_rice.batch', residuals)
+    x, y = compositions(r[:, None], z, K)
+    return r, x, y
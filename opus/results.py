@@ -0,0 +1,437 @@
+"""Columnar files of flash results written and read in chunks.
+
+Sweeps can solve more cases than fit in memory as Stream objects. A
+ResultsWriter collects rows of named columns (from solved Flash units,
+Streams or the arrays of solve_batch() and SweepExecutor.map()) and appends
+them to disk every chunk_size rows, so its memory does not grow with the
+number of cases. A ResultsReader loads single columns, or iterates over
+their chunks, without reading the other columns.
+
+Three formats are supported, chosen by the extension of the file:
+
+* .npz: one .npy member per column and chunk, named column/000000.npy. It
+  can be opened with numpy.load() too.
+* .jsonl: one line per column and chunk, {"column": ..., "values": [...]}.
+  The reader only parses the lines of the columns it needs.
+* .csv: one line per row with a header. Readable by any tool, but reading a
+  column scans every line.
+
+Columns of the built-in rows, with temperatures in K, pressures in kPa and
+flows in kmol/h:
+
+* vapor_fraction
+* feed.flow, feed.temperature, feed.pressure and feed.<tag> for the molar
+  fraction of every substance, the same for vapor and liquid.
+
+Examples
+--------
+>>> with ResultsWriter('sweep.npz') as writer:
+        for T in temperatures:
+            inlet.temperature.value = T
+            flash.solve()
+            writer.write_flash(flash)
+>>> ResultsReader('sweep.npz').read('vapor.propane')
+"""
+import csv
+import itertools
+import json
+import os
+import zipfile
+
+import numpy as np
+
+from helpers import converter
+from opus.mixer import molar_flow
+
+
+FORMATS = ('npz', 'jsonl', 'csv')
+CHUNK_SIZE = 65536
+
+
+class ResultsWriter:
+    """Represents a columnar file of results being written.
+
+    The columns are fixed by the first write. Rows are kept in memory until
+    chunk_size of them are buffered and then appended to the file.
+
+    Attributes
+    ----------
+    path : string
+        The file.
+    format : string
+        'npz', 'jsonl' or 'csv'.
+    chunk_size : int
+        Rows buffered before writing.
+    columns : list
+        Names of the columns, None before the first write.
+    rows : int
+        Rows written to the file or buffered.
+    """
+
+    def __init__(self, path, format=None, chunk_size=CHUNK_SIZE,
+                 compress=False):
+        """Create a new file of results, replacing any previous one
+
+        Parameters
+        ----------
+        path : string
+            File to write.
+        format : string
+            'npz', 'jsonl' or 'csv'. By default the extension of path.
+        chunk_size : int
+            Rows buffered before writing.
+        compress : bool
+            Deflate the members of a npz file.
+        """
+        self.path = path
+        self.format = file_format(path, format)
+        self.chunk_size = chunk_size
+        self.columns = None
+        self.rows = 0
+        self.chunks = 0
+        self.buffer = {}
+        self.buffered = 0
+
+        self.csv = None
+        if self.format == 'npz':
+            self.file = zipfile.ZipFile(
+                path, 'w', zipfile.ZIP_DEFLATED if compress
+                else zipfile.ZIP_STORED, allowZip64=True)
+        else:
+            self.file = open(path, 'w', newline='', encoding='utf-8')
+            self.csv = csv.writer(self.file) if self.format == 'csv' \
+                else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, columns):
+        """Append rows.
+
+        Parameters
+        ----------
+        columns : dict
+            Column name : array of values, all with the same length, or
+            scalars for one row.
+        """
+        if self.file is None:
+            raise ValueError('{} is closed'.format(self.path))
+
+        arrays = {name: np.atleast_1d(np.asarray(values))
+                  for name, values in columns.items()}
+        lengths = {len(values) for values in arrays.values()}
+        if len(lengths) != 1:
+            raise ValueError('The columns must have the same length')
+        if self.columns is None:
+            self.columns = list(arrays)
+            self.buffer = {name: [] for name in self.columns}
+            if self.csv is not None:
+                self.csv.writerow(self.columns)
+        elif set(arrays) != set(self.columns):
+            raise ValueError('The columns {} do not match the file columns {}'
+                             .format(sorted(arrays), self.columns))
+
+        # Long arrays are cut into chunks of chunk_size rows
+        rows = lengths.pop()
+        start = 0
+        while start < rows:
+            stop = min(rows, start + self.chunk_size - self.buffered)
+            for name in self.columns:
+                self.buffer[name].append(arrays[name][start:stop])
+            self.buffered += stop - start
+            self.rows += stop - start
+            start = stop
+            if self.buffered >= self.chunk_size:
+                self.flush()
+
+    def write_flash(self, flash):
+        """Append the inlet, the products and V/F of a solved Flash"""
+        self.write(flash_columns(flash))
+
+    def write_stream(self, stream, prefix=None):
+        """Append the flow, conditions and composition of a Stream"""
+        self.write(stream_columns(stream, prefix))
+
+    def write_batch(self, components, r, x, y, temperatures=None,
+                    pressures=None, temperature_units='K',
+                    pressure_units='kPa'):
+        """Append the arrays of a batch of flashes.
+
+        Parameters
+        ----------
+        components : iterable
+            Substance objects ordered as the columns of x and y.
+        r, x, y : numpy.ndarray
+            Results of opus.flash.solve_batch() or SweepExecutor.map().
+        temperatures, pressures : numpy.ndarray
+            Conditions of the cases, written in K and kPa.
+        temperature_units : str
+            Units of the temperatures.
+        pressure_units : str
+            Units of the pressures.
+        """
+        self.write(batch_columns(components, r, x, y, temperatures,
+                                 pressures, temperature_units,
+                                 pressure_units))
+
+    def flush(self):
+        """Append the buffered rows to the file"""
+        if not self.buffered:
+            return
+        arrays = {name: np.concatenate(chunks)
+                  for name, chunks in self.buffer.items()}
+        for chunks in self.buffer.values():
+            chunks.clear()
+        self.buffered = 0
+
+        if self.format == 'npz':
+            for name in self.columns:
+                member = '{}/{:06d}.npy'.format(name, self.chunks)
+                with self.file.open(member, 'w', force_zip64=True) as file:
+                    np.lib.format.write_array(file, arrays[name],
+                                              allow_pickle=False)
+        elif self.format == 'jsonl':
+            for name in self.columns:
+                self.file.write(json.dumps(
+                    {'column': name, 'chunk': self.chunks,
+                     'values': arrays[name].tolist()}) + '\n')
+        else:
+            self.csv.writerows(zip(*(arrays[name].tolist()
+                                     for name in self.columns)))
+        self.chunks += 1
+
+    def close(self):
+        """Write the buffered rows and close the file"""
+        if self.file is None:
+            return
+        self.flush()
+        self.file.close()
+        self.file = None
+
+
+class ResultsReader:
+    """Represents a columnar file of results written by ResultsWriter.
+
+    Attributes
+    ----------
+    path : string
+        The file.
+    format : string
+        'npz', 'jsonl' or 'csv'.
+    columns : list
+        Names of the columns.
+    """
+
+    def __init__(self, path, format=None):
+        self.path = path
+        self.format = file_format(path, format)
+
+        if self.format == 'npz':
+            with zipfile.ZipFile(path) as file:
+                members = file.namelist()
+            self.members = {}
+            for member in members:
+                name = member.rsplit('/', 1)[0]
+                self.members.setdefault(name, []).append(member)
+            self.columns = list(self.members)
+        elif self.format == 'jsonl':
+            # The first chunk has a line for every column, only the names
+            # at the start of its lines are decoded
+            self.columns = []
+            decoder = json.JSONDecoder()
+            with open(path, encoding='utf-8') as file:
+                for line in file:
+                    name = decoder.raw_decode(line, len('{"column": '))[0]
+                    if name in self.columns:
+                        break
+                    self.columns.append(name)
+        else:
+            with open(path, newline='', encoding='utf-8') as file:
+                self.columns = next(csv.reader(file), [])
+
+    def __len__(self):
+        """Number of rows"""
+        if not self.columns:
+            return 0
+        if self.format == 'npz':
+            rows = 0
+            with zipfile.ZipFile(self.path) as file:
+                for member in self.members[self.columns[0]]:
+                    with file.open(member) as array:
+                        version = np.lib.format.read_magic(array)
+                        header = np.lib.format.read_array_header_1_0 \
+                            if version == (1, 0) \
+                            else np.lib.format.read_array_header_2_0
+                        shape = header(array)[0]
+                    rows += shape[0]
+            return rows
+        return sum(len(values) for values in self.chunks(self.columns[0]))
+
+    def index(self, column):
+        if column not in self.columns:
+            raise KeyError('{} is not a column of {}'
+                           .format(column, self.path))
+        return self.columns.index(column)
+
+    def chunks(self, column, chunk_size=CHUNK_SIZE):
+        """Iterate over the values of a column chunk by chunk.
+
+        Parameters
+        ----------
+        column : string
+            Name of the column.
+        chunk_size : int
+            Rows per chunk for CSV files. The other formats give the chunks
+            as written.
+
+        Yields
+        ------
+        numpy.ndarray
+            The values of the next chunk.
+        """
+        index = self.index(column)
+        if self.format == 'npz':
+            with zipfile.ZipFile(self.path) as file:
+                for member in self.members[column]:
+                    with file.open(member) as array:
+                        yield np.lib.format.read_array(array,
+                                                       allow_pickle=False)
+        elif self.format == 'jsonl':
+            # Lines of other columns are skipped without parsing them
+            prefix = json.dumps({'column': column})[:-1] + ', "chunk"'
+            with open(self.path, encoding='utf-8') as file:
+                for line in file:
+                    if line.startswith(prefix):
+                        yield np.array(json.loads(line)['values'])
+        else:
+            with open(self.path, newline='', encoding='utf-8') as file:
+                rows = csv.reader(file)
+                next(rows, None)
+                while True:
+                    values = [row[index]
+                              for row in itertools.islice(rows, chunk_size)]
+                    if not values:
+                        break
+                    yield parse_values(values)
+
+    def read(self, column):
+        """Load every value of a column.
+
+        Returns
+        -------
+        numpy.ndarray
+            The values of the column.
+        """
+        chunks = list(self.chunks(column))
+        if not chunks:
+            return np.array([])
+        return np.concatenate(chunks)
+
+    def read_columns(self, columns=None):
+        """Load some columns.
+
+        Returns
+        -------
+        dict
+            Column name : array of values. Every column when columns is None.
+        """
+        if columns is None:
+            columns = self.columns
+        return {column: self.read(column) for column in columns}
+
+
+def file_format(path, format=None):
+    """Format of a results file from its extension when it is not given"""
+    if format is None:
+        format = os.path.splitext(path)[1].lstrip('.').lower()
+    if format not in FORMATS:
+        raise ValueError('Unknown results format {}, use one of {}'
+                         .format(format, ', '.join(FORMATS)))
+    return format
+
+
+def parse_values(values):
+    """Convert the CSV values of a column to floats, or keep the strings"""
+    try:
+        return np.array(values, dtype=float)
+    except ValueError:
+        return np.array(values)
+
+
+def flash_columns(flash):
+    """Row of a solved Flash with V/F and the columns of its inlet (feed)
+    and products (vapor and liquid), see stream_columns().
+
+    Returns
+    -------
+    dict
+        Column name : value.
+    """
+    columns = {'vapor_fraction': flash.vapor_fraction}
+    for prefix, stream in (('feed', flash.inlet), ('vapor', flash.vapor),
+                           ('liquid', flash.liquid)):
+        columns.update(stream_columns(stream, prefix))
+    return columns
+
+
+def stream_columns(stream, prefix=None):
+    """Row of a Stream with its flow in kmol/h, temperature in K, pressure in
+    kPa and molar fractions.
+
+    Parameters
+    ----------
+    stream : Stream
+        The stream.
+    prefix : string
+        Start of the column names. By default stream.tag.
+
+    Returns
+    -------
+    dict
+        Column name : value.
+    """
+    prefix = stream.tag if prefix is None else prefix
+    temperature = stream.temperature
+    pressure = stream.pressure
+    columns = {
+        prefix + '.flow': molar_flow(stream),
+        prefix + '.temperature': np.nan if temperature is None else
+        converter.temperature(temperature.value, temperature.units, 'k'),
+        prefix + '.pressure': np.nan if pressure is None else
+        converter.pressure(pressure.value, pressure.units, 'kPa'),
+    }
+    for tag, value in zip(stream.components.tags, stream.composition):
+        columns[prefix + '.' + tag] = value
+    return columns
+
+
+def batch_columns(components, r, x, y, temperatures=None, pressures=None,
+                  temperature_units='K', pressure_units='kPa'):
+    """Columns of a batch of flashes, see ResultsWriter.write_batch()
+
+    Returns
+    -------
+    dict
+        Column name : array of values.
+    """
+    r = np.atleast_1d(r)
+    x = np.atleast_2d(x)
+    y = np.atleast_2d(y)
+    columns = {}
+    if temperatures is not None:
+        columns['feed.temperature'] = np.broadcast_to(converter.temperature(
+            np.asarray(temperatures, dtype=float), temperature_units, 'k'),
+            r.shape)
+    if pressures is not None:
+        columns['feed.pressure'] = np.broadcast_to(converter.pressure(
+            np.asarray(pressures, dtype=float), pressure_units, 'kPa'),
+            r.shape)
+    columns['vapor_fraction'] = r
+    for i, substance in enumerate(components):
+        columns['vapor.' + substance.tag] = y[:, i]
+    for i, substance in enumerate(components):
+        columns['liquid.' + substance.tag] = x[:, i]
+    return columns
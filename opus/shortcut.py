@@ -0,0 +1,415 @@
+"""Fenske-Underwood-Gilliland shortcut design of distillation columns.
+
+Every function works over whole arrays of design cases: the arguments are
+broadcast against each other, so a study of 10^5 combinations of keys,
+recoveries and reflux ratios is a few array operations instead of a loop.
+
+The relative volatilities follow Raoult's law, alpha = Psat / Psat of the
+heavy key, so they only depend on the temperature and are evaluated with the
+vapor pressures of the substances, the same as Flash and Column.
+
+Cases without a meaningful answer (a light key that is not more volatile
+than the heavy key, recoveries outside (0, 1) or a reflux ratio below the
+minimum) give NaN instead of raising, so a screening study keeps going.
+"""
+from helpers import converter
+from opus.flash import solve_batch
+import numpy as np
+
+
+def vapor_pressures(substances, temperatures, temperature_units='K'):
+    """Compute the vapor pressure of every substance over an array of
+    temperatures.
+
+    Parameters
+    ----------
+    substances : list
+        Substance objects.
+    temperatures : numpy.ndarray
+        Temperatures with any shape.
+    temperature_units : str
+        Units of the temperatures.
+
+    Returns
+    -------
+    numpy.ndarray
+        Vapor pressures in bar with shape temperatures.shape + (components,).
+        They can be given as alpha to shortcut(), which divides them by the
+        column of the heavy key.
+    """
+    temperatures = converter.temperature(
+        np.asarray(temperatures, dtype=float), temperature_units, 'k')
+    return np.stack([substance.get_vapor_pressure_array(temperatures)
+                     for substance in substances], axis=-1)
+
+
+def fenske(alpha, light_recovery, heavy_recovery):
+    """Minimum number of stages at total reflux.
+
+    Parameters
+    ----------
+    alpha : numpy.ndarray
+        Relative volatility of the light key to the heavy key.
+    light_recovery : numpy.ndarray
+        Fraction of the light key fed that leaves in the distillate.
+    heavy_recovery : numpy.ndarray
+        Fraction of the heavy key fed that leaves in the bottoms.
+
+    Returns
+    -------
+    numpy.ndarray
+        Minimum number of equilibrium stages, including the reboiler.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        separation = (light_recovery / (1 - light_recovery)) \
+                     * (heavy_recovery / (1 - heavy_recovery))
+        stages = np.log(separation) / np.log(alpha)
+    valid = (alpha > 1) & (light_recovery > 0) & (light_recovery < 1) \
+            & (heavy_recovery > 0) & (heavy_recovery < 1)
+    return np.where(valid, stages, np.nan)
+
+
+def underwood_root(alpha, z, q, lower, upper, tol=1e-12, maxiter=100):
+    """Solve sum(alpha z / (alpha - theta)) = 1 - q for theta in every case.
+
+    The function is increasing between two consecutive poles, so each case
+    has one root in (lower, upper). Newton steps that leave the bracket are
+    replaced by bisection and the bracket shrinks on every iteration, for
+    all the cases at once.
+
+    Parameters
+    ----------
+    alpha : numpy.ndarray
+        Relative volatilities with shape (cases, components).
+    z : numpy.ndarray
+        Feed molar fractions with shape (cases, components).
+    q : numpy.ndarray
+        Feed quality with shape (cases,).
+    lower, upper : numpy.ndarray
+        Consecutive relative volatilities enclosing the root, (cases,).
+
+    Returns
+    -------
+    numpy.ndarray
+        theta with shape (cases,).
+    """
+    lower = lower.copy()
+    upper = upper.copy()
+    theta = 0.5 * (lower + upper)
+    target = 1 - q
+
+    for _ in range(maxiter):
+        difference = alpha - theta[:, None]
+        terms = alpha * z / difference
+        f = terms.sum(axis=1) - target
+        slope = (terms / difference).sum(axis=1)
+
+        lower = np.where(f < 0, theta, lower)
+        upper = np.where(f > 0, theta, upper)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = theta - f / slope
+        inside = (newton > lower) & (newton < upper)
+        new = np.where(inside, newton, 0.5 * (lower + upper))
+
+        change = np.abs(new - theta)
+        theta = new
+        if not np.any(change > tol * np.abs(theta)):
+            break
+    return theta
+
+
+def underwood(alpha, z, q, light, heavy, distillate, valid):
+    """Minimum reflux ratio with every Underwood root between the keys.
+
+    The poles are the volatilities of the keys and of the components of the
+    feed between them. There is one root between every two consecutive
+    poles, and for each root theta_j
+
+        sum(alpha_i d_i / (alpha_i - theta_j)) = Vmin
+
+    where d_i is the distillate of component i per unit of feed. The d_i of
+    the keys and of the components outside them are known, so the
+    equations are linear in Vmin and the d_i of the components between the
+    keys, and are solved for all the cases at once.
+
+    Parameters
+    ----------
+    alpha : numpy.ndarray
+        Volatilities relative to the heavy key, (cases, components).
+    z : numpy.ndarray
+        Feed molar fractions, (cases, components).
+    q : numpy.ndarray
+        Feed quality, (cases,).
+    light, heavy : numpy.ndarray
+        Positions of the keys, (cases,).
+    distillate : numpy.ndarray
+        Fraction of every component fed that leaves in the distillate,
+        (cases, components). Only the keys and the components outside them
+        are used.
+    valid : numpy.ndarray
+        Cases to solve, the others give NaN.
+
+    Returns
+    -------
+    tuple
+        Minimum reflux ratio and the root just above the heavy key, with
+        shape (cases,), and the distillate fractions with the components
+        between the keys replaced by the ones of Underwood, bounded to
+        [0, 1].
+    """
+    cases, components = alpha.shape
+    rows = np.arange(cases)
+    alpha_light = alpha[rows, light]
+    present = (z > 0) & valid[:, None]
+    between = present & (alpha > 1) & (alpha < alpha_light[:, None])
+
+    # Poles sorted in every case, padded with inf
+    poles = np.where(between, alpha, np.inf)
+    poles[rows, heavy] = 1.0
+    poles[rows, light] = np.where(valid, alpha_light, np.inf)
+    poles = np.sort(poles, axis=1)
+    intermediates = between.sum(axis=1)
+    size = int(intermediates.max()) + 1 if cases else 1
+
+    # Unknowns: d of the components between the keys, ranked by position,
+    # and Vmin last. Unused unknowns of a case get identity rows.
+    rank = np.cumsum(between, axis=1) - 1
+    flows = np.where(between, 0.0, z * distillate)
+    matrix = np.zeros((cases, size, size))
+    rhs = np.zeros((cases, size))
+    thetas = np.full((cases, size), np.nan)
+    case_index, component_index = np.nonzero(between)
+    for j in range(size):
+        used = valid & (j <= intermediates)
+        lower = np.where(used, poles[:, j], 1.0)
+        upper = np.where(used, poles[:, min(j + 1, components - 1)], 2.0)
+        upper = np.where(np.isfinite(upper) & (upper > lower), upper,
+                         lower + 1)
+        theta = underwood_root(alpha, z, q, lower, upper)
+        thetas[:, j] = np.where(used, theta, np.nan)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            terms = alpha / (alpha - theta[:, None])
+        rhs[:, j] = np.where(used, -(terms * flows).sum(axis=1), 0.0)
+        matrix[:, j, size - 1] = np.where(used, -1.0, 0.0)
+        selected = used[case_index]
+        matrix[case_index[selected], j, rank[case_index, component_index]
+               [selected]] = terms[case_index, component_index][selected]
+        matrix[~used, j, j - 1 if j else size - 1] = 1.0
+
+    solution = np.linalg.solve(matrix, rhs[..., None])[..., 0]
+    vapor = solution[:, size - 1]
+    unknown = np.zeros((cases, components))
+    unknown[case_index, component_index] = \
+        solution[case_index, rank[case_index, component_index]]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        D = (flows + unknown).sum(axis=1)
+        minimum_reflux = np.where(valid, vapor / D - 1, np.nan)
+        fraction = np.clip(unknown / z, 0.0, 1.0)
+    distillate = np.where(between, fraction, distillate)
+    return minimum_reflux, thetas[:, 0], distillate
+
+
+def gilliland(minimum_stages, minimum_reflux, reflux_ratio):
+    """Number of stages at a reflux ratio with Molokanov's form of the
+    Gilliland correlation.
+
+    Returns
+    -------
+    numpy.ndarray
+        Number of equilibrium stages, including the reboiler. NaN when the
+        reflux ratio is not above the minimum.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        X = (reflux_ratio - minimum_reflux) / (reflux_ratio + 1)
+        Y = 1 - np.exp((1 + 54.4 * X) / (11 + 117.2 * X)
+                       * (X - 1) / np.sqrt(X))
+        stages = (minimum_stages + Y) / (1 - Y)
+    return np.where(X > 0, stages, np.nan)
+
+
+def shortcut(alpha, z, q, light, heavy, light_recovery, heavy_recovery,
+             reflux_factor=1.3, reflux_ratio=None):
+    """Fenske-Underwood-Gilliland design of arrays of cases.
+
+    The components lighter than the light key and heavier than the heavy
+    key are distributed with the Fenske equation at the minimum number of
+    stages. When the keys are not adjacent, the components between them
+    distribute too: every Underwood root between the volatilities of the
+    keys is solved, and the equations of all the roots give the minimum
+    vapor flow and the distillate of those components together (Underwood's
+    class 2 separation). For adjacent keys there is a single root.
+
+    Parameters
+    ----------
+    alpha : numpy.ndarray
+        Volatilities with shape (cases, components) or (components,), in any
+        reference, as they are divided by the volatility of the heavy key.
+    z : numpy.ndarray
+        Feed molar fractions with shape (cases, components) or
+        (components,).
+    q : numpy.ndarray
+        Feed quality, the fraction of the feed that joins the liquid.
+    light, heavy : numpy.ndarray
+        Positions of the light and heavy keys in the components.
+    light_recovery, heavy_recovery : numpy.ndarray
+        Fraction of the light key in the distillate and of the heavy key in
+        the bottoms.
+    reflux_factor : numpy.ndarray
+        Reflux ratio as a multiple of the minimum reflux ratio.
+    reflux_ratio : numpy.ndarray
+        Reflux ratio L/D. It replaces reflux_factor when given.
+
+    Returns
+    -------
+    dict
+        Arrays with shape (cases,): 'minimum_stages', 'minimum_reflux',
+        'reflux_ratio', 'stages', 'feed_stage' (Kirkbride, counted from the
+        condenser) and 'theta', the Underwood root just above the heavy key;
+        and 'distillate' with shape
+        (cases, components), the fraction of every component fed that leaves
+        in the distillate.
+    """
+    alpha = np.asarray(alpha, dtype=float)
+    z = np.asarray(z, dtype=float)
+    components = alpha.shape[-1]
+    q = np.asarray(q, dtype=float)
+    light = np.asarray(light)
+    heavy = np.asarray(heavy)
+    light_recovery = np.asarray(light_recovery, dtype=float)
+    heavy_recovery = np.asarray(heavy_recovery, dtype=float)
+    reflux = np.asarray(reflux_factor if reflux_ratio is None
+                        else reflux_ratio, dtype=float)
+    shape = np.broadcast_shapes(alpha.shape[:-1], z.shape[:-1], q.shape,
+                                light.shape, heavy.shape,
+                                light_recovery.shape, heavy_recovery.shape,
+                                reflux.shape)
+    cases = int(np.prod(shape)) if shape else 1
+
+    def flat(value):
+        return np.broadcast_to(value, shape).reshape(cases)
+
+    alpha = np.broadcast_to(alpha, shape + (components,)) \
+        .reshape(cases, components)
+    z = np.broadcast_to(z, shape + (components,)).reshape(cases, components)
+    q = flat(q)
+    light = flat(light).astype(int)
+    heavy = flat(heavy).astype(int)
+    light_recovery = flat(light_recovery)
+    heavy_recovery = flat(heavy_recovery)
+    reflux = flat(reflux)
+    rows = np.arange(cases)
+
+    alpha = alpha / alpha[rows, heavy][:, None]
+    alpha_light = alpha[rows, light]
+    minimum_stages = fenske(alpha_light, light_recovery, heavy_recovery)
+
+    # Fenske distribution: d/b = (d/b of the heavy key) alpha^Nmin
+    with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+        ratio = (1 - heavy_recovery)[:, None] / heavy_recovery[:, None] \
+                * alpha ** minimum_stages[:, None]
+        distillate = ratio / (1 + ratio)
+    distillate[rows, light] = light_recovery
+    distillate[rows, heavy] = 1 - heavy_recovery
+
+    minimum_reflux, theta, distillate = underwood(
+        alpha, z, q, light, heavy, distillate, ~np.isnan(minimum_stages))
+
+    flows = z * distillate
+    D = flows.sum(axis=1)
+
+    if reflux_ratio is None:
+        reflux = reflux * minimum_reflux
+    stages = gilliland(minimum_stages, minimum_reflux, reflux)
+
+    # Kirkbride: N_rectifying / N_stripping
+    B = 1 - D
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_light_bottoms = z[rows, light] * (1 - light_recovery) / B
+        x_heavy_distillate = z[rows, heavy] * (1 - heavy_recovery) / D
+        split = (z[rows, heavy] / z[rows, light]
+                 * (x_light_bottoms / x_heavy_distillate)**2 * B / D)**0.206
+    feed_stage = stages * split / (1 + split) + 1
+
+    return {
+        'minimum_stages': minimum_stages.reshape(shape),
+        'minimum_reflux': minimum_reflux.reshape(shape),
+        'reflux_ratio': reflux.reshape(shape),
+        'stages': stages.reshape(shape),
+        'feed_stage': feed_stage.reshape(shape),
+        'theta': theta.reshape(shape),
+        'distillate': distillate.reshape(shape + (components,)),
+    }
+
+
+def design(feed, light_key, heavy_key, light_recovery, heavy_recovery,
+           reflux_factor=1.3, reflux_ratio=None, feed_quality=None,
+           temperatures=None, temperature_units='K'):
+    """Shortcut design of a column for a feed stream over arrays of cases.
+
+    Parameters
+    ----------
+    feed : Stream
+        Feed with composition, pressure and temperature.
+    light_key, heavy_key : str or numpy.ndarray
+        Substance.tag or position in feed.components of the keys. An array
+        of positions screens several key choices at once.
+    light_recovery, heavy_recovery : numpy.ndarray
+        Fraction of the light key in the distillate and of the heavy key in
+        the bottoms.
+    reflux_factor : numpy.ndarray
+        Reflux ratio as a multiple of the minimum reflux ratio.
+    reflux_ratio : numpy.ndarray
+        Reflux ratio L/D. It replaces reflux_factor when given.
+    feed_quality : numpy.ndarray
+        q of the feed. By default 1 - V/F of the feed flashed at its
+        temperature and pressure.
+    temperatures : numpy.ndarray
+        Temperatures where the relative volatilities are evaluated. By
+        default the feed temperature.
+    temperature_units : str
+        Units of temperatures.
+
+    Returns
+    -------
+    dict
+        The arrays of shortcut(), plus 'distillate_rate', the distillate in
+        the units of the feed flow rate.
+
+    Examples
+    --------
+    Screening recoveries and reflux factors for the n-butane / n-pentane
+    split of the main.py feed
+
+    >>> recovery = np.linspace(0.9, 0.999, 300)[:, None]
+    >>> factor = np.linspace(1.05, 2.0, 300)
+    >>> result = design(inlet, 'butane', 'pentane', recovery, recovery,
+                        factor)
+    >>> result['stages'].shape
+    (300, 300)
+    """
+    index = feed.components.index
+    light = index[light_key] if isinstance(light_key, str) else light_key
+    heavy = index[heavy_key] if isinstance(heavy_key, str) else heavy_key
+
+    temperature = converter.temperature(feed.temperature.value,
+                                        feed.temperature.units, 'k')
+    if temperatures is None:
+        temperatures = temperature
+        temperature_units = 'K'
+    alpha = vapor_pressures(feed.components, temperatures,
+                            temperature_units)
+
+    if feed_quality is None:
+        r, _, _ = solve_batch(feed.components, temperature,
+                              feed.pressure.value, feed.composition,
+                              pressure_units=feed.pressure.units)
+        feed_quality = 1 - r[0]
+
+    result = shortcut(alpha, feed.composition, feed_quality, light, heavy,
+                      light_recovery, heavy_recovery, reflux_factor,
+                      reflux_ratio)
+    result['distillate_rate'] = feed.flow_rate.value * (
+        result['distillate'] * feed.composition).sum(axis=-1)
+    return result
@@ -0,0 +1,400 @@
+"""Isothermal flash sweeps distributed over a pool of processes.
+
+The compiled Antoine tables and molecular weights of the substances are
+packed once into a shared memory block. Every worker attaches to it when it
+starts and evaluates the vapor pressures from views of that block, so the
+Substance objects are never pickled and NIST is never scraped again.
+
+The inputs of a sweep are broadcast into another shared block and the
+results are written by the workers into preallocated shared arrays, so a
+task only carries the range of cases of its chunk.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import multiprocessing
+import os
+
+from helpers import converter
+from streams.antoine import AntoineTable
+from opus import rachford_rice
+import numpy as np
+
+
+class SharedTables:
+    """Represents the property tables of some substances in shared memory.
+
+    The block holds, for every substance, the edges and the coefficients of
+    its AntoineTable, followed by the molecular weights of all of them. The
+    layout is a small tuple of offsets that can be sent to other processes.
+
+    Attributes
+    ----------
+    memory : SharedMemory
+        The block, owned by the process that created the object.
+    layout : tuple
+        (name of the block, molecular weights offset, rows) where rows has
+        (edges offset, edges, coefficients offset, segments, gap policy,
+        extrapolate policy) for every substance.
+    """
+
+    def __init__(self, substances):
+        tables = [substance.antoine_table for substance in substances]
+        size = sum(table.edges.size + table.coefficients.size
+                   for table in tables) + len(tables)
+
+        self.memory = shared_memory.SharedMemory(create=True, size=8 * size)
+        data = np.ndarray(size, dtype=float, buffer=self.memory.buf)
+
+        rows = []
+        offset = 0
+        for table in tables:
+            edges, coefficients = table.edges, table.coefficients
+            start = offset + edges.size
+            data[offset:start] = edges
+            data[start:start + coefficients.size] = coefficients.ravel()
+            rows.append((offset, edges.size, start, len(coefficients),
+                         table.gap, table.extrapolate))
+            offset = start + coefficients.size
+
+        data[offset:] = [substance.molecular_weight
+                         for substance in substances]
+        self.layout = (self.memory.name, offset, tuple(rows))
+
+    def close(self):
+        """Release and remove the block"""
+        self.memory.close()
+        self.memory.unlink()
+
+
+def attach_tables(layout):
+    """Rebuild the tables of a SharedTables layout in another process.
+
+    Returns
+    -------
+    tuple
+        The attached SharedMemory (keep it alive while the tables are used),
+        the list of AntoineTable objects and the array of molecular weights.
+    """
+    name, weights_offset, rows = layout
+    memory = shared_memory.SharedMemory(name=name)
+    data = np.ndarray(weights_offset + len(rows), dtype=float,
+                      buffer=memory.buf)
+
+    tables = []
+    for offset, edges, start, segments, gap, extrapolate in rows:
+        tables.append(AntoineTable.from_compiled(
+            data[offset:offset + edges],
+            data[start:start + 3 * segments].reshape(segments, 3),
+            gap=gap, extrapolate=extrapolate))
+    return memory, tables, data[weights_offset:]
+
+
+# Tables of the worker process, set by initialize_worker()
+worker = {}
+
+
+def initialize_worker(layout):
+    worker['memory'], worker['tables'], worker['weights'] = \
+        attach_tables(layout)
+
+
+def solve_chunk(name, cases, components, pressure_units, start, stop):
+    """Solve the cases start:stop of the arrays in a shared block.
+
+    The block holds the inputs T (K), P, z and the outputs r, x, y, one
+    after the other, each one with cases rows.
+    """
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        T, P, z, r, x, y = sweep_arrays(memory, cases, components)
+        temperatures = T[start:stop]
+        Ps = np.column_stack([table.vapor_pressure_array(temperatures)
+                              for table in worker['tables']])
+        Ps = converter.pressure(Ps, 'bar', pressure_units)
+        K = Ps / P[start:stop, None]
+        r[start:stop], x[start:stop], y[start:stop] = \
+            rachford_rice.solve_many(z[start:stop], K)
+        del T, P, z, r, x, y, temperatures
+    finally:
+        memory.close()
+    return stop - start
+
+
+def sweep_arrays(memory, cases, components):
+    """Views of the inputs and outputs of a sweep in its shared block"""
+    data = np.ndarray(cases * (3 + 3 * components), dtype=float,
+                      buffer=memory.buf)
+    T, P, z, r, x, y = np.split(data, np.cumsum(
+        [cases, cases, cases * components, cases, cases * components]))
+    return (T, P, z.reshape(cases, components), r,
+            x.reshape(cases, components), y.reshape(cases, components))
+
+
+def sweep_inputs(temperatures, pressures, compositions, temperature_units,
+                 components):
+    """Broadcast the inputs of a sweep to flat arrays.
+
+    Returns
+    -------
+    tuple
+        T in K and P with shape (cases,) and z with shape
+        (cases, components).
+    """
+    temperatures = converter.temperature(
+        np.asarray(temperatures, dtype=float), temperature_units, 'k')
+    pressures = np.asarray(pressures, dtype=float)
+    compositions = np.asarray(compositions, dtype=float)
+    shape = np.broadcast_shapes(np.shape(temperatures), np.shape(pressures),
+                                compositions.shape[:-1])
+    cases = int(np.prod(shape)) if shape else 1
+    return (np.broadcast_to(temperatures, shape).reshape(cases),
+            np.broadcast_to(pressures, shape).reshape(cases),
+            np.broadcast_to(compositions,
+                            shape + (components,)).reshape(cases, components))
+
+
+def share_inputs(temperatures, pressures, compositions):
+    """Create a shared block for a sweep and copy its inputs into it.
+
+    The block is removed again if it cannot be filled.
+
+    Returns
+    -------
+    SharedMemory
+        The block, see sweep_arrays().
+    """
+    cases, components = compositions.shape
+    memory = shared_memory.SharedMemory(
+        create=True, size=8 * cases * (3 + 3 * components))
+    try:
+        T, P, z, _, _, _ = sweep_arrays(memory, cases, components)
+        T[:] = temperatures
+        P[:] = pressures
+        z[:] = compositions
+        del T, P, z
+    except BaseException:
+        release(memory)
+        raise
+    return memory
+
+
+def release(memory):
+    """Remove a shared block and close it"""
+    memory.unlink()
+    try:
+        memory.close()
+    except BufferError:
+        # Views left by an error still export the buffer, the mapping is
+        # freed with them
+        pass
+
+
+def empty_results(components):
+    """Results of a sweep without cases"""
+    return np.empty(0), np.empty((0, components)), np.empty((0, components))
+
+
+class SweepExecutor:
+    """Solves large sweeps of isothermal flashes in a pool of processes.
+
+    The pool and the shared tables are created once and reused by every
+    call to map(), so a study can run many sweeps without starting the
+    workers again. Use it as a context manager or call close().
+
+    Attributes
+    ----------
+    substances : list
+        Substance objects of the feeds.
+    max_workers : int
+        Processes of the pool. By default the number of CPUs.
+    chunk_size : int
+        Cases per task. By default the cases are split into four chunks per
+        worker, with at least 2000 cases each.
+
+    Examples
+    --------
+    Monte Carlo study of the main.py flash
+
+    >>> rng = np.random.default_rng()
+    >>> with SweepExecutor(substances) as executor:
+            r, x, y = executor.map(rng.normal(323, 5, 10**7),
+                                   rng.normal(200, 10, 10**7),
+                                   [0.3, 0.1, 0.15, 0.45])
+    """
+
+    def __init__(self, substances, max_workers=None, chunk_size=None,
+                 start_method=None):
+        self.substances = list(substances)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.start_method = start_method
+        self.tables = SharedTables(self.substances)
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self):
+        """Start the workers, attached to the shared tables"""
+        if self.pool is None:
+            context = multiprocessing.get_context(self.start_method)
+            self.pool = ProcessPoolExecutor(
+                self.max_workers, mp_context=context,
+                initializer=initialize_worker,
+                initargs=(self.tables.layout,))
+        return self.pool
+
+    def close(self):
+        """Stop the workers and remove the shared tables"""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.tables is not None:
+            self.tables.close()
+            self.tables = None
+
+    def chunks(self, cases):
+        """Split the cases into (start, stop) ranges"""
+        size = self.chunk_size
+        if size is None:
+            size = max(2000, -(-cases // (4 * self.max_workers)))
+        return [(start, min(start + size, cases))
+                for start in range(0, cases, size)]
+
+    def map(self, temperatures, pressures, compositions,
+            temperature_units='K', pressure_units='kPa'):
+        """Solve a sweep of isothermal flashes.
+
+        The arguments are broadcast against each other the same as in
+        opus.flash.solve_batch(), which gives the same results.
+
+        Parameters
+        ----------
+        temperatures : numpy.ndarray
+            Temperatures with shape (cases,).
+        pressures : numpy.ndarray
+            Pressures with shape (cases,).
+        compositions : numpy.ndarray
+            Feed molar fractions with shape (cases, components) or
+            (components,).
+        temperature_units : str
+            Units of the temperatures.
+        pressure_units : str
+            Units of the pressures.
+
+        Returns
+        -------
+        tuple
+            Arrays of V/F with shape (cases,), x and y with shape
+            (cases, components).
+        """
+        if self.tables is None:
+            raise ValueError('The executor is closed')
+
+        components = len(self.substances)
+        inputs = sweep_inputs(temperatures, pressures, compositions,
+                              temperature_units, components)
+        cases = len(inputs[0])
+        if cases == 0:
+            return empty_results(components)
+
+        memory = share_inputs(*inputs)
+        try:
+            pool = self.start()
+            futures = [pool.submit(solve_chunk, memory.name, cases,
+                                   components, pressure_units, start, stop)
+                       for start, stop in self.chunks(cases)]
+            for future in futures:
+                future.result()
+
+            _, _, _, r, x, y = sweep_arrays(memory, cases, components)
+            results = r.copy(), x.copy(), y.copy()
+            del r, x, y
+        finally:
+            release(memory)
+        return results
+
+    def imap(self, batches, temperature_units='K', pressure_units='kPa',
+             max_pending=None):
+        """Solve an iterable of batches of flashes lazily.
+
+        Every batch gets its own shared block and task. Only max_pending
+        batches are read from the iterable and solved ahead of the consumer,
+        so the iterable can be longer than the memory and a consumer that
+        stops early leaves the rest unread.
+
+        Parameters
+        ----------
+        batches : iterable
+            Tuples of temperatures, pressures and compositions, broadcast the
+            same as in map().
+        temperature_units : str
+            Units of the temperatures.
+        pressure_units : str
+            Units of the pressures.
+        max_pending : int
+            Batches solved ahead of the consumer. By default two per worker.
+
+        Yields
+        ------
+        tuple
+            Arrays of V/F, x and y of every batch, in order.
+        """
+        if self.tables is None:
+            raise ValueError('The executor is closed')
+        if max_pending is None:
+            max_pending = 2 * self.max_workers
+
+        pool = self.start()
+        components = len(self.substances)
+        pending = deque()
+
+        def submit(temperatures, pressures, compositions):
+            inputs = sweep_inputs(temperatures, pressures, compositions,
+                                  temperature_units, components)
+            cases = len(inputs[0])
+            if cases == 0:
+                pending.append((None, 0, None))
+                return
+            memory = share_inputs(*inputs)
+            try:
+                future = pool.submit(solve_chunk, memory.name, cases,
+                                     components, pressure_units, 0, cases)
+            except BaseException:
+                release(memory)
+                raise
+            pending.append((memory, cases, future))
+
+        def collect():
+            memory, cases, future = pending.popleft()
+            if memory is None:
+                return empty_results(components)
+            try:
+                future.result()
+                _, _, _, r, x, y = sweep_arrays(memory, cases, components)
+                results = r.copy(), x.copy(), y.copy()
+                del r, x, y
+            finally:
+                release(memory)
+            return results
+
+        try:
+            for batch in batches:
+                submit(*batch)
+                if len(pending) >= max_pending:
+                    yield collect()
+            while pending:
+                yield collect()
+        finally:
+            # A consumer that stopped early leaves batches in the pool
+            while pending:
+                memory, _, future = pending.popleft()
+                if memory is None:
+                    continue
+                if not future.cancel():
+                    future.exception()
+                release(memory)
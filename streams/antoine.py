@@ -0,0 +1,264 @@
+import bisect
+import numpy as np
+
+
+class AntoineTable:
+    """Represents the Antoine equation rows of a substance compiled into a
+    sorted interval index.
+
+    The temperature ranges of the rows are split at every range limit into
+    consecutive segments, each one with the coefficients that apply to it,
+    so finding the coefficients for a temperature is a bisection. The vapor
+    pressure is log10(P) = A - B / (C + T), with P in bar and T in K.
+
+    The policies decide what happens where the rows do not have exactly one
+    answer:
+
+    * overlap: two or more ranges contain the temperature. 'first' uses the
+      first row of the table (the NIST order), 'last' the last one and
+      'narrowest' the row with the shortest range.
+    * gap: the temperature is between two ranges. 'nearest' extends the
+      range closer to the temperature, 'nan' returns NaN and 'raise' raises
+      a ValueError.
+    * extrapolate: the temperature is below or above every range. 'nearest'
+      extends the lowest or highest range, 'nan' returns NaN and 'raise'
+      raises a ValueError.
+
+    Attributes
+    ----------
+    rows : list
+        Antoine rows as [[lower_lim, higher_lim], A, B, C].
+    edges : numpy.ndarray
+        Limits of the segments in K.
+    coefficients : numpy.ndarray
+        A, B and C of every segment with shape (segments, 3). NaN for the
+        gaps with the 'nan' or 'raise' policies.
+    """
+
+    # Default policies for every new table
+    overlap = 'first'
+    gap = 'nearest'
+    extrapolate = 'nearest'
+
+    def __init__(self, rows, overlap=None, gap=None, extrapolate=None):
+        """Create a new AntoineTable object from the Substance.antoine rows
+
+        Parameters
+        ----------
+        rows : list
+            Antoine rows as [[lower_lim, higher_lim], A, B, C].
+        overlap : string
+            'first', 'last' or 'narrowest'.
+        gap : string
+            'nearest', 'nan' or 'raise'.
+        extrapolate : string
+            'nearest', 'nan' or 'raise'.
+        """
+        if overlap is not None:
+            self.overlap = overlap
+        if gap is not None:
+            self.gap = gap
+        if extrapolate is not None:
+            self.extrapolate = extrapolate
+        if self.overlap not in ('first', 'last', 'narrowest'):
+            raise ValueError('Unknown overlap policy {}'.format(self.overlap))
+        if self.gap not in ('nearest', 'nan', 'raise'):
+            raise ValueError('Unknown gap policy {}'.format(self.gap))
+        if self.extrapolate not in ('nearest', 'nan', 'raise'):
+            raise ValueError('Unknown extrapolate policy {}'
+                             .format(self.extrapolate))
+        if len(rows) == 0:
+            raise ValueError('The Antoine table does not have rows')
+
+        self.rows = rows
+        self.compile()
+
+    @classmethod
+    def from_compiled(cls, edges, coefficients, overlap=None, gap=None,
+                      extrapolate=None):
+        """Rebuild a table from the edges and coefficients of compile().
+
+        The rows are not needed, so a table can be evaluated from arrays
+        kept elsewhere (for example in shared memory) without copying them.
+        """
+        table = cls.__new__(cls)
+        if overlap is not None:
+            table.overlap = overlap
+        if gap is not None:
+            table.gap = gap
+        if extrapolate is not None:
+            table.extrapolate = extrapolate
+        table.rows = None
+        table.gaps = None
+        table.edges = edges
+        table.coefficients = coefficients
+        table.edges_list = edges.tolist()
+        return table
+
+    def compile(self):
+        """Split the ranges into segments and choose their coefficients"""
+        limits = sorted({limit for row in self.rows for limit in row[0]})
+        edges = [limits[0]]
+        coefficients = []
+        self.gaps = []
+
+        for low, high in zip(limits[:-1], limits[1:]):
+            middle = 0.5 * (low + high)
+            row = self.choose([row for row in self.rows
+                               if row[0][0] <= middle <= row[0][1]])
+
+            if row is not None:
+                edges.append(high)
+                coefficients.append(row[1:])
+                continue
+
+            self.gaps.append((low, high))
+            if self.gap == 'nearest':
+                # The lower half of the gap extends the range below it and
+                # the upper half the range above it
+                below = self.choose([row for row in self.rows
+                                     if row[0][1] == low])
+                above = self.choose([row for row in self.rows
+                                     if row[0][0] == high])
+                edges.extend([middle, high])
+                coefficients.extend([below[1:], above[1:]])
+            else:
+                edges.append(high)
+                coefficients.append([np.nan] * 3)
+
+        self.edges = np.array(edges, dtype=float)
+        self.coefficients = np.array(coefficients, dtype=float)
+        self.edges_list = edges
+
+    def choose(self, rows):
+        """Pick one of the rows covering a segment with the overlap policy"""
+        if not rows:
+            return None
+        if self.overlap == 'first':
+            return rows[0]
+        if self.overlap == 'last':
+            return rows[-1]
+        return min(rows, key=lambda row: row[0][1] - row[0][0])
+
+    def segment(self, temperature):
+        """Find the index of the segment of a temperature in K.
+
+        Returns
+        -------
+        int
+            Index into coefficients or None if the temperature is NaN or
+            outside every range with the extrapolate policy 'nan'.
+        """
+        last = len(self.coefficients) - 1
+        index = bisect.bisect_right(self.edges_list, temperature) - 1
+        if 0 <= index <= last or temperature == self.edges_list[-1]:
+            return min(index, last)
+
+        if temperature != temperature:
+            return None
+        if self.extrapolate == 'raise':
+            raise ValueError('{} K is outside the Antoine ranges {} - {} K'
+                             .format(temperature, self.edges_list[0],
+                                     self.edges_list[-1]))
+        if self.extrapolate == 'nan':
+            return None
+        return 0 if index < 0 else last
+
+    def vapor_pressure(self, temperature):
+        """Evaluate the vapor pressure at one temperature.
+
+        Parameters
+        ----------
+        temperature : float
+            Temperature in K.
+
+        Returns
+        -------
+        float
+            Vapor pressure in bar.
+        """
+        index = self.segment(temperature)
+        if index is None:
+            return np.nan
+
+        A, B, C = self.coefficients[index]
+        if A != A and temperature == self.edges_list[index] and index > 0:
+            # The upper limit of the range below the gap is inclusive
+            A, B, C = self.coefficients[index - 1]
+        if self.gap == 'raise' and A != A:
+            raise ValueError('{} K is in a gap between Antoine ranges'
+                             .format(temperature))
+        return 10 ** (A - B/(C + temperature))
+
+    def lookup(self, temperatures):
+        """Find the coefficients for an array of temperatures.
+
+        Parameters
+        ----------
+        temperatures : numpy.ndarray
+            Temperatures in K.
+
+        Returns
+        -------
+        tuple
+            Arrays A, B and C with the same shape as temperatures. NaN where
+            the policies leave the vapor pressure undefined.
+        """
+        temperatures = np.asarray(temperatures, dtype=float)
+        last = len(self.coefficients) - 1
+        index = np.searchsorted(self.edges, temperatures, side='right') - 1
+
+        outside = (index < 0) | (index > last)
+        outside &= temperatures != self.edges[-1]
+        if self.extrapolate == 'raise' and outside.any():
+            raise ValueError('Temperatures outside the Antoine ranges {} - {} '
+                             'K'.format(self.edges[0], self.edges[-1]))
+
+        # The upper limit of the range below a gap is inclusive
+        index = np.clip(index, 0, last)
+        at_gap = np.isnan(self.coefficients[index, 0]) & (index > 0)
+        at_gap &= temperatures == self.edges[index]
+        index = np.where(at_gap, index - 1, index)
+
+        A, B, C = np.moveaxis(self.coefficients[index], -1, 0)
+        if self.gap == 'raise' and np.isnan(A[~outside]).any():
+            raise ValueError('Temperatures in a gap between Antoine ranges')
+
+        if self.extrapolate == 'nan':
+            A = np.where(outside | np.isnan(temperatures), np.nan, A)
+        return A, B, C
+
+    def vapor_pressure_array(self, temperatures):
+        """Evaluate the vapor pressure over an array of temperatures at once.
+
+        Parameters
+        ----------
+        temperatures : numpy.ndarray
+            Temperatures in K.
+
+        Returns
+        -------
+        numpy.ndarray
+            Vapor pressures in bar with the same shape as temperatures.
+        """
+        temperatures = np.asarray(temperatures, dtype=float)
+        A, B, C = self.lookup(temperatures)
+        return 10 ** (A - B/(C + temperatures))
+
+    def log_slope_array(self, temperatures):
+        """Evaluate d ln(P) / dT over an array of temperatures.
+
+        Parameters
+        ----------
+        temperatures : numpy.ndarray
+            Temperatures in K.
+
+        Returns
+        -------
+        numpy.ndarray
+            Derivative of the natural logarithm of the vapor pressure in 1/K.
+        """
+        temperatures = np.asarray(temperatures, dtype=float)
+        A, B, C = self.lookup(temperatures)
+        slope = np.log(10) * B / (C + temperatures)**2
+        return np.where(np.isnan(A), np.nan, slope)
@@ -0,0 +1,116 @@
+from collections.abc import MutableMapping
+from types import MappingProxyType
+import weakref
+import numpy as np
+
+
+class ComponentSet:
+    """Represents the ordered substances carried by one or more streams.
+
+    The streams built from the same list of Substance objects share one
+    ComponentSet, which maps every Substance.tag to its position in the
+    composition arrays of the streams.
+
+    Attributes
+    ----------
+    substances : tuple
+        Substance objects in order.
+    tags : tuple
+        Substance.tag of every substance in the same order.
+    names : tuple
+        Substance.name of every substance in the same order.
+    index : dict
+        Substance.tag : position pairs.
+    by_tag : mappingproxy
+        Read-only Substance.tag : Substance pairs.
+    """
+
+    __slots__ = ('substances', 'tags', 'names', 'index', 'by_tag',
+                 '__weakref__')
+
+    # Shared sets, alive while some stream uses them. As the set keeps its
+    # substances alive, the ids of the key always refer to the same objects.
+    interned = weakref.WeakValueDictionary()
+
+    def __init__(self, substances):
+        """Create a new ComponentSet object
+
+        Parameters
+        ----------
+        substances : list
+            Substance objects, or any object with the attributes name and tag
+        """
+        self.substances = tuple(substances)
+        self.tags = tuple(substance.tag for substance in self.substances)
+        self.names = tuple(substance.name for substance in self.substances)
+        self.index = {tag: i for i, tag in enumerate(self.tags)}
+        self.by_tag = MappingProxyType(dict(zip(self.tags, self.substances)))
+
+    @classmethod
+    def of(cls, substances):
+        """Return the shared ComponentSet of a list of substances.
+
+        Parameters
+        ----------
+        substances : list
+            Substance objects or a ComponentSet.
+
+        Returns
+        -------
+        ComponentSet
+            The same object for every call with the same substances in the
+            same order.
+        """
+        if isinstance(substances, cls):
+            return substances
+
+        substances = tuple(substances)
+        key = tuple(id(substance) for substance in substances)
+        components = cls.interned.get(key)
+        if components is None:
+            components = cls(substances)
+            cls.interned[key] = components
+        return components
+
+    def __len__(self):
+        return len(self.substances)
+
+    def __iter__(self):
+        return iter(self.substances)
+
+    def molecular_weights(self):
+        """Molecular weights of the substances as an array"""
+        return np.array([substance.molecular_weight
+                         for substance in self.substances])
+
+
+class CompositionView(MutableMapping):
+    """Dict-like view of the composition array of a stream.
+
+    Reading and writing by Substance.tag goes to the array of the stream, so
+    code written for the dict of compositions keeps working.
+    """
+
+    __slots__ = ('components', 'array')
+
+    def __init__(self, components, array):
+        self.components = components
+        self.array = array
+
+    def __getitem__(self, tag):
+        return float(self.array[self.components.index[tag]])
+
+    def __setitem__(self, tag, value):
+        self.array[self.components.index[tag]] = value
+
+    def __delitem__(self, tag):
+        raise TypeError('The substances of a stream cannot be removed')
+
+    def __iter__(self):
+        return iter(self.components.tags)
+
+    def __len__(self):
+        return len(self.components.tags)
+
+    def __repr__(self):
+        return repr(dict(self))
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""This module provides the ideal enthalpy model of the substances.
+
+The vapor is an ideal gas with the enthalpy of the ideal-gas heat capacity
+Cp = A + B T + C T^2 + D T^3 (J/mol/K, T in K) from 298.15 K, and the liquid
+is an ideal solution whose enthalpy is the one of the vapor minus the heat
+of vaporization. The heat of vaporization comes from the Clausius-Clapeyron
+equation on the Antoine equation of the substance,
+
+    dHvap = R T^2 dln(Psat)/dT = R T^2 ln(10) B / (C + T)^2
+
+so the energy balances are consistent with the K-values of Raoult's law.
+Every enthalpy is in kJ/kmol (the same as J/mol).
+"""
+import numpy as np
+
+
+# kJ/kmol/K
+R = 8.314462618
+
+# Reference temperature of the enthalpies in K, ideal gas at 298.15 K
+REFERENCE = 298.15
+
+# Ideal-gas heat capacity coefficients A, B, C, D with Cp in J/mol/K and T
+# in K, from The Properties of Gases and Liquids (Reid, Prausnitz and
+# Poling), by Substance.tag. Other substances can be given a heat_capacity
+# directly.
+HEAT_CAPACITIES = {
+    'propane': (-4.224, 3.063e-1, -1.586e-4, 3.215e-8),
+    'butane': (9.487, 3.313e-1, -1.108e-4, -2.822e-9),
+    'isobutane': (-1.390, 3.847e-1, -1.846e-4, 2.895e-8),
+    'pentane': (-3.626, 4.873e-1, -2.580e-4, 5.305e-8),
+    'hexane': (-4.413, 5.820e-1, -3.119e-4, 6.494e-8),
+}
+
+
+def heat_capacity(coefficients, temperatures):
+    """Ideal-gas heat capacity in kJ/kmol/K at temperatures in K"""
+    A, B, C, D = coefficients
+    T = np.asarray(temperatures, dtype=float)
+    return A + T * (B + T * (C + T * D))
+
+
+def ideal_gas_enthalpy(coefficients, temperatures):
+    """Ideal-gas enthalpy in kJ/kmol from REFERENCE to temperatures in K"""
+    A, B, C, D = coefficients
+    T = np.asarray(temperatures, dtype=float)
+
+    def integral(T):
+        return T * (A + T * (B / 2 + T * (C / 3 + T * D / 4)))
+
+    return integral(T) - integral(REFERENCE)
+
+
+def vaporization_enthalpy(table, temperatures):
+    """Heat of vaporization in kJ/kmol from an AntoineTable"""
+    T = np.asarray(temperatures, dtype=float)
+    return R * T**2 * table.log_slope_array(T)
+
+
+def vaporization_enthalpy_slope(table, temperatures):
+    """Derivative of the heat of vaporization in kJ/kmol/K"""
+    T = np.asarray(temperatures, dtype=float)
+    _, B, C = table.lookup(T)
+    return 2 * R * np.log(10) * B * C * T / (C + T)**3
@@ -18,6 +18,8 @@ class Parameter:
         In lowercase. The actual units of the measurement.  
     """
 
+    __slots__ = ('name', 'value', 'units')
+
     def __init__(self, name, value, units):
         """Create a new Parameter object define as a pair of number-units values
         
@@ -31,6 +33,10 @@ class Parameter:
             In lowercase. The actual units of the measurement
         """
         self.name = name
-        self.tag = name_to_tag(name)
         self.value = value
-        self.units = units
\ No newline at end of file
+        self.units = units
+
+    @property
+    def tag(self):
+        """The name of the parameter as a return of name_to_tag()"""
+        return name_to_tag(self.name)
\ No newline at end of file
@@ -1,39 +1,84 @@
 from helpers.helpers import name_to_tag
-from helpers.helpers import to_dict
-from helpers.helpers import get_names
 from streams.parameter import Parameter
+from streams.components import ComponentSet
+from streams.components import CompositionView
+import numpy as np
 
 class Stream:
+    """Represents a stream line with its parameters and the substances it
+    carries.
+
+    The molar fractions are stored in one float array, ordered as the
+    ComponentSet shared with the other streams of the same substances.
+
+    Attributes
+    ----------
+    name : string
+        The name of the stream.
+    tag : string
+        The name of the stream as a return of name_to_tag().
+    components : ComponentSet
+        The substances of the stream.
+    composition : numpy.ndarray
+        Molar fractions ordered as components.
+    flow_rate : Parameter
+        Flow rate of the stream.
+    pressure : Parameter
+        Pressure of the stream.
+    temperature : Parameter
+        Temperature of the stream.
+    """
+
+    __slots__ = ('name', 'tag', 'components', 'composition', 'flow_rate',
+                 'pressure', 'temperature')
 
     def __init__(self, name,
         substances = None,
         flow_rate = None,
-        compositions = None, 
-        pressure = None, 
+        compositions = None,
+        pressure = None,
         temperature = None
         ):
 
         self.name = name
         self.tag = name_to_tag(name)
-        self.substances = to_dict(substances)
-        self.substances_names = get_names(substances)
+        self.components = ComponentSet.of(substances)
 
         # Flow rates
         if flow_rate == None:
             self.flow_rate = Parameter('Mass Flow Rate', 0, 'kmol/h')
         else:
-            self.flow_rate = flow_rate    
+            self.flow_rate = flow_rate
 
         # Compositions
-        self.compositions = {}
-        if compositions != None:
-            for i in range(len(substances)):
-                tag = substances[i].tag
-                self.compositions[tag] = compositions[i]
-        else:
-            for tag, _ in self.substances.items():
-                self.compositions[tag] = 0        
+        self.composition = np.zeros(len(self.components))
+        if compositions is not None:
+            self.compositions = compositions
 
         # Parameters of the process
         self.pressure = pressure
-        self.temperature = temperature 
\ No newline at end of file
+        self.temperature = temperature
+
+    @property
+    def substances(self):
+        """Read-only Substance.tag : Substance pairs"""
+        return self.components.by_tag
+
+    @property
+    def substances_names(self):
+        """List of the names of the substances"""
+        return list(self.components.names)
+
+    @property
+    def compositions(self):
+        """Dict-like Substance.tag : molar fraction view of composition"""
+        return CompositionView(self.components, self.composition)
+
+    @compositions.setter
+    def compositions(self, compositions):
+        # A dict by tag or a list ordered as the substances
+        if hasattr(compositions, 'keys'):
+            for tag, value in compositions.items():
+                self.composition[self.components.index[tag]] = value
+        else:
+            self.composition[:] = compositions
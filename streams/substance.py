@@ -1,53 +1,333 @@
 from helpers import scraping
 from helpers import converter
 from helpers import helpers
+from helpers import cache as property_cache
+from helpers import database as property_database
+from helpers import instrumentation
+from streams.antoine import AntoineTable
+from streams import enthalpy
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import numpy as np
 
 
 class Substance:
 
-    def __init__(self, name):
+    # Only the parsed properties are kept, the NIST page is dropped after
+    # extracting them
+    __slots__ = ('name', 'tag', 'molecular_weight', 'antoine',
+                 'antoine_table', 'heat_capacity')
+
+    # NIST WebBook page with the phase change data. It can point to a local
+    # server serving saved pages.
+    url = 'https://webbook.nist.gov/cgi/cbook.cgi?Name={0}&Mask=4'
+
+    def __init__(self, name, cache=None, session=None, html=None,
+                 database=None):
         self.name = name
         self.tag = helpers.name_to_tag(name)
 
-        # Get the properties from NIST
-        self.html_bs4 = self.get_html_bs4()
-        self.molecular_weight = self.get_molecular_weight()
-        self.antoine = self.get_antoine()
+        if cache is None:
+            cache = property_cache.default_cache
+        if database is None:
+            database = property_database.default_database
+
+        # A saved NIST page given in html is parsed without using the cache
+        # or the database
+        if html is not None:
+            cache = None
+            database = None
+
+        # Look for the properties in the bundled database and then in the
+        # ones already parsed before going to NIST
+        record = database.get(self.tag) if database is not None else None
+        if record is not None and instrumentation.enabled:
+            instrumentation.count('database.hits')
+        if record is None and cache is not None:
+            record = cache.get(self.tag)
+        if record is not None:
+            self.molecular_weight = record['molecular_weight']
+            self.antoine = tuple((tuple(temperatures), A, B, C)
+                                 for temperatures, A, B, C
+                                 in record['antoine'])
+
+        elif cache is not None and cache.offline:
+            raise LookupError('{} is not in the property cache at {} and '
+                              'the cache is offline'.format(self.name,
+                                                            cache.directory))
+
+        else:
+            # Get the properties from NIST or from the saved page. The page
+            # is not kept.
+            if html is None:
+                html = self.get_html(session)
+            start = instrumentation.clock() if instrumentation.enabled \
+                else None
+            self.molecular_weight = self.get_molecular_weight(html)
+            if start is not None:
+                middle = instrumentation.clock()
+                instrumentation.record('parse.molecular_weight',
+                                       middle - start, substance=self.tag)
+            self.antoine = self.get_antoine(html)
+            if start is not None:
+                instrumentation.record('parse.antoine',
+                                       instrumentation.clock() - middle,
+                                       substance=self.tag)
+
+            if cache is not None:
+                cache.set(self.tag, {
+                    'name': self.name,
+                    'molecular_weight': self.molecular_weight,
+                    'antoine': self.antoine
+                })
+
+        # Interval index of the Antoine ranges with the default policies. It
+        # can be replaced with another AntoineTable to change them.
+        self.antoine_table = AntoineTable(self.antoine)
+
+        # Ideal-gas Cp coefficients A, B, C, D in J/mol/K, None if unknown.
+        # NIST phase change pages do not have them, so they come from the
+        # table of streams.enthalpy or are set by hand.
+        self.heat_capacity = enthalpy.HEAT_CAPACITIES.get(self.tag)
+
+    @classmethod
+    def load_many(cls, names, max_workers=8, cache=None, retries=3,
+                  backoff=0.5):
+        """Load many substances concurrently.
+
+        The pages are downloaded and parsed in a thread pool sharing one
+        keep-alive HTTP session, so the cold start of a large library costs
+        about one round-trip per max_workers substances instead of one per
+        substance. Substances already in the cache are not downloaded.
+
+        Parameters
+        ----------
+        names : list
+            Names of the substances.
+        max_workers : int
+            Maximum number of simultaneous downloads.
+        cache : PropertyCache
+            Cache used by every substance. By default the shared one.
+        retries : int
+            Number of retries of a failed request.
+        backoff : float
+            Backoff factor in seconds between retries. It doubles on every
+            retry.
+
+        Returns
+        -------
+        list
+            Substance objects in the same order as names.
+
+        Examples
+        --------
+        >>> Substance.load_many(['Propane', 'Butane', 'Pentane', 'Hexane'])
+        [<streams.substance.Substance>, <streams.substance.Substance>,
+        <streams.substance.Substance>, <streams.substance.Substance>]
+        """
+        names = list(names)
+        with scraping.new_session(max_workers, retries, backoff) as session:
+            with ThreadPoolExecutor(max_workers) as executor:
+                return list(executor.map(
+                    lambda name: cls(name, cache=cache, session=session),
+                    names))
+
+    @classmethod
+    async def load_async(cls, name, client=None, cache=None, database=None):
+        """Create a Substance without blocking the event loop.
+
+        The database and the cache are read as in the constructor. A missing
+        substance is downloaded with an AsyncClient. Reading the cache,
+        parsing the page and storing it in the cache run in the default
+        executor. Concurrent calls for the same substance on the same client
+        share one download and one parse.
+
+        Parameters
+        ----------
+        name : string
+            Name of the substance.
+        client : AsyncClient
+            Client of helpers.async_scraping. By default a new one, closed
+            after the download.
+        cache : PropertyCache
+            By default the shared one.
+        database : PropertyDatabase
+            By default the bundled one.
+
+        Returns
+        -------
+        Substance
+
+        Examples
+        --------
+        >>> async with AsyncClient(rate=2) as client:
+                propane = await Substance.load_async('Propane', client)
+        """
+        from helpers import async_scraping
+
+        tag = helpers.name_to_tag(name)
+        if cache is None:
+            cache = property_cache.default_cache
+        if database is None:
+            database = property_database.default_database
+
+        # The cache is a file, so it is only read and written in the
+        # executor, the same as the page is parsed
+        def known():
+            if (database is not None and tag in database) or \
+                    (cache is not None and (cache.offline or
+                                            cache.get(tag) is not None)):
+                return cls(name, cache=cache, database=database)
+            return None
+
+        def parse(html):
+            substance = cls(name, html=html)
+            if cache is not None:
+                cache.set(tag, {
+                    'name': substance.name,
+                    'molecular_weight': substance.molecular_weight,
+                    'antoine': substance.antoine
+                })
+            return substance
 
-    def get_html_bs4(self):
-        url = 'https://webbook.nist.gov/cgi/cbook.cgi?Name={0}&Mask=4'\
-            .format(self.tag)
-        return scraping.get_html_bs4(url)
+        loop = asyncio.get_running_loop()
+        substance = await loop.run_in_executor(None, known)
+        if substance is not None:
+            return substance
 
-    def get_molecular_weight(self):
-        css_element = '#main > ul:nth-of-type(1) > li:nth-of-type(2)'
-        li = scraping.scrap_properties(self.html_bs4, css_element).text
-        return float(li.replace(" ", "").split(':')[1])
+        if client is None:
+            async with async_scraping.AsyncClient() as client:
+                return await cls.load_async(name, client, cache, database)
+
+        async def load():
+            html = await async_scraping.get_html(cls.url.format(tag), client)
+            return await loop.run_in_executor(None, parse, html)
+
+        return await client.coalesce(('substance', tag), load)
+
+    @classmethod
+    async def load_many_async(cls, names, client=None, cache=None,
+                              database=None):
+        """Create many substances concurrently without blocking the event
+        loop, sharing one AsyncClient.
+
+        Returns
+        -------
+        list
+            Substance objects in the same order as names.
+        """
+        from helpers import async_scraping
+
+        if client is None:
+            async with async_scraping.AsyncClient() as client:
+                return await cls.load_many_async(names, client, cache,
+                                                 database)
+        return list(await asyncio.gather(*(
+            cls.load_async(name, client, cache, database) for name in names)))
+
+    def get_html(self, session=None):
+        url = self.url.format(self.tag)
+        return scraping.get_html(url, session)
+
+    def get_molecular_weight(self, html):
+        # Only the list items of the page are parsed. The molecular weight is
+        # the one labeled 'Molecular weight: 44.0956'
+        for li in scraping.parse_elements(html, 'li'):
+            text = li.get_text()
+            if text.strip().startswith('Molecular weight'):
+                return float(text.replace(" ", "").split(':')[1])
+
+        raise Exception('Molecular weight not found for {}'.format(self.name))
 
     def get_vapor_pressure(self, temperature):
+        """Evaluate the vapor pressure with the Antoine equation.
+
+        The gaps, overlaps and extrapolation of the Antoine ranges follow the
+        policies of self.antoine_table.
+
+        Parameters
+        ----------
+        temperature : Parameter
+            Temperature of the substance.
+
+        Returns
+        -------
+        float
+            Vapor pressure in bar.
+        """
+        if instrumentation.enabled:
+            instrumentation.count('psat.evaluations')
         temperature = converter.temperature(temperature.value,
                                             temperature.units, 'k')
-        for row in self.antoine:
-            if row[0][0] <= temperature <= row[0][1]:
-                A = row[1]
-                B = row[2]
-                C = row[3]
-                return 10 ** (A - B/(C + temperature))
-
-        return None    
-
-    def get_antoine(self):
-        css_element = 'table'
-        unique_property = 'aria-label'
-        property_value = 'Antoine Equation Parameters'
-        table = scraping.scrap_properties(self.html_bs4, css_element,
-                                          unique_property, property_value)
+        return self.antoine_table.vapor_pressure(temperature)
+
+    def get_vapor_pressure_array(self, temperatures):
+        """Evaluate the vapor pressure over an array of temperatures at once.
+
+        Parameters
+        ----------
+        temperatures : numpy.ndarray
+            Temperatures in K.
+
+        Returns
+        -------
+        numpy.ndarray
+            Vapor pressures in bar.
+        """
+        if instrumentation.enabled:
+            instrumentation.count('psat.evaluations', np.size(temperatures))
+        return self.antoine_table.vapor_pressure_array(temperatures)
+
+    def get_vapor_enthalpy(self, temperatures):
+        """Evaluate the ideal-gas enthalpy over an array of temperatures.
+
+        Parameters
+        ----------
+        temperatures : numpy.ndarray
+            Temperatures in K.
+
+        Returns
+        -------
+        numpy.ndarray
+            Enthalpy in kJ/kmol from the ideal gas at 298.15 K.
+        """
+        if self.heat_capacity is None:
+            raise ValueError('{} does not have heat capacity data'
+                             .format(self.name))
+        return enthalpy.ideal_gas_enthalpy(self.heat_capacity, temperatures)
+
+    def get_liquid_enthalpy(self, temperatures):
+        """Evaluate the liquid enthalpy over an array of temperatures.
+
+        It is the ideal-gas enthalpy minus the heat of vaporization from the
+        Antoine equation (Clausius-Clapeyron).
+
+        Parameters
+        ----------
+        temperatures : numpy.ndarray
+            Temperatures in K.
+
+        Returns
+        -------
+        numpy.ndarray
+            Enthalpy in kJ/kmol from the ideal gas at 298.15 K.
+        """
+        return self.get_vapor_enthalpy(temperatures) \
+            - enthalpy.vaporization_enthalpy(self.antoine_table, temperatures)
+
+    def get_antoine(self, html):
+        # Only the table with the Antoine parameters is parsed
+        tables = scraping.parse_elements(
+            html, 'table', {'aria-label': 'Antoine Equation Parameters'})
+        if not tables:
+            raise Exception('Antoine parameters not found for {}'
+                            .format(self.name))
 
         # Extract the rows from the table. Knowing what tags have an HTML table.
         # Also, knowing that the fist row with he table header does not have the
         # class attribute 'exp' so we obtain just the rows with data.
         # The find_all function from BeautifulSoup return a list
-        rows = table.find_all('tr', class_='exp')
+        rows = tables[0].find_all('tr', class_='exp')
 
         # Declaring the lists for storage Temperatures and coefficients.
         coefficients = []
@@ -62,8 +342,8 @@ class Substance:
             # limit (lower and higher)
             lower_lim = float(cols[0].text.replace(" ", "").split('-')[0])
             higher_lim = float(cols[0].text.replace(" ", "").split('-')[1])
-            temperatures = [lower_lim, higher_lim]
+            temperatures = (lower_lim, higher_lim)
 
-            coefficients.append([temperatures, A, B, C])
+            coefficients.append((temperatures, A, B, C))
 
-        return coefficients
+        return tuple(coefficients)